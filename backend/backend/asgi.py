@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """Django, with the async database pool opened and closed with the server"""
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+
+    from file_processing import async_db
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await async_db.open_pool()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_db.close_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
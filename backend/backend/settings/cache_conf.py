@@ -0,0 +1,30 @@
+import os
+
+
+# Query embedding cache: in-process LRU tier and shared (database) tier sizes
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(
+    os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "1024")
+)
+EMBEDDING_CACHE_SHARED_ENTRIES = int(
+    os.getenv("EMBEDDING_CACHE_SHARED_ENTRIES", "100_000")
+)
+# Number of inserted embeddings after which the shared tier is trimmed
+EMBEDDING_CACHE_EVICTION_INTERVAL = int(
+    os.getenv("EMBEDDING_CACHE_EVICTION_INTERVAL", "100")
+)
+
+# Upper bound on knowledge source ids held by the in-process access scope cache
+ACCESS_SCOPE_CACHE_MAX_IDS = int(os.getenv("ACCESS_SCOPE_CACHE_MAX_IDS", "1_000_000"))
+
+# Number of subjects whose materialized access scope freshness is remembered
+ACCESS_SCOPE_CACHE_MAX_SUBJECTS = int(
+    os.getenv("ACCESS_SCOPE_CACHE_MAX_SUBJECTS", "10_000")
+)
+
+# Parsed chunk bodies kept in memory, bounded by their total length in characters
+CHUNK_CACHE_MAX_CHARACTERS = int(os.getenv("CHUNK_CACHE_MAX_CHARACTERS", "50_000_000"))
+
+# Retrieved chunks kept in memory, bounded by their total length in characters; 0 disables
+RESULT_CACHE_MAX_CHARACTERS = int(
+    os.getenv("RESULT_CACHE_MAX_CHARACTERS", "20_000_000")
+)
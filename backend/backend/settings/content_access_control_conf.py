@@ -3,3 +3,5 @@ from django.conf import settings
 
 CASBIN_MODEL = str(settings.BASE_DIR / "dauthz_model.conf")
 CASBIN_ENFORCER_EAGER_LOAD = False
+# Invalidates the materialized access scopes on policy changes
+CASBIN_ADAPTER = "file_processing.access_scopes.PolicyAdapter"
@@ -0,0 +1,29 @@
+import os
+
+
+# "events": every chunk and query file saved for an uploaded file is indexed
+# on its own storage event. "direct": the upload event indexes the whole
+# document in process, in one job, before its task is acknowledged: the
+# service request timeout and the task dispatch deadline must cover it (see
+# `infrastructure`), or the `ingest_document` command run as a job.
+INGESTION_PIPELINE = os.getenv("INGESTION_PIPELINE", "events")
+
+# With the direct pipeline, still writes the generated queries to files, as
+# an audit trail (their events are ignored)
+INGESTION_QUERY_ARTIFACTS = os.getenv("INGESTION_QUERY_ARTIFACTS", "False") == "True"
+
+# Query generations of the chunks of a document running at once (direct pipeline)
+QUERY_GENERATION_CONCURRENCY = int(os.getenv("QUERY_GENERATION_CONCURRENCY", "8"))
+# Retries of a generation answered with a rate limit error, the first one after
+# QUERY_GENERATION_BACKOFF seconds, then twice as long every time
+QUERY_GENERATION_MAX_RETRIES = int(os.getenv("QUERY_GENERATION_MAX_RETRIES", "5"))
+QUERY_GENERATION_BACKOFF = float(os.getenv("QUERY_GENERATION_BACKOFF", "2.0"))
+# Query generation apps kept running by every process and reused by its
+# generations (at most this many generations run at once, per process)
+QUERY_GENERATION_SESSIONS = int(
+    os.getenv("QUERY_GENERATION_SESSIONS", QUERY_GENERATION_CONCURRENCY)
+)
+
+# Copies the queries and vectors of an already indexed chunk with the same
+# content digest, instead of generating and embedding them again
+CHUNK_DEDUPLICATION = os.getenv("CHUNK_DEDUPLICATION", "True") == "True"
@@ -0,0 +1,16 @@
+import os
+
+
+# Bounds, in seconds, of the buckets of the retrieval stage latency histograms
+RETRIEVAL_TIMING_BUCKETS = [
+    float(bound)
+    for bound in os.getenv(
+        "RETRIEVAL_TIMING_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+]
+
+# Returns the per-stage timings of the retrieval in the `Server-Timing` header
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "False") == "True"
+
+# Bearer token of the Prometheus scraper on `/metrics/`, which is closed when empty
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
@@ -0,0 +1,69 @@
+import os
+
+
+# Size of the dynamic candidate list of the HNSW index scan (pgvector default: 40).
+# Higher values improve recall at the cost of latency; can be overridden per request.
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+
+# Every chunk is indexed through several generated queries, so the nearest
+# neighbour search over-fetches this many query hits per requested chunk
+# before grouping them by chunk.
+RETRIEVAL_CANDIDATES_PER_CHUNK = int(os.getenv("RETRIEVAL_CANDIDATES_PER_CHUNK", "5"))
+
+# Compact ANN index shortlisting the candidates, which are then reranked with the
+# full precision vectors: "subvector" - first 1024 dimensions as halfvec,
+# "binary" - binary quantization (smallest index, needs more oversampling).
+RETRIEVAL_FIRST_PASS = os.getenv("RETRIEVAL_FIRST_PASS", "subvector")
+
+# Extra candidates shortlisted by the compact index for the exact rerank
+RETRIEVAL_RERANK_OVERSAMPLING = int(os.getenv("RETRIEVAL_RERANK_OVERSAMPLING", "2"))
+
+# Default retrieval mode: "vector", "lexical" (full-text only, no embedding),
+# "hybrid" (both, merged by reciprocal rank fusion) or "auto" (lexical for
+# identifier-like queries, hybrid otherwise). Can be overridden per request.
+# Only "vector" scores are cosine similarities: the other modes are opt-in as
+# their scores are text ranks or fused ranks.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+
+# Rank constant of the reciprocal rank fusion: sum(1 / (k + rank))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+# Reranker of the retrieved candidates: "bm25" (local, lexical), "cross_encoder"
+# (small CPU model, needs `sentence-transformers`, installed separately) or
+# empty to disable.
+# Can be overridden per request, as can the diversity.
+RERANKER = os.getenv("RERANKER", "")
+RERANK_CROSS_ENCODER_MODEL = os.getenv(
+    "RERANK_CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+# Candidates fetched per requested chunk when reranking
+RERANK_CANDIDATES_PER_RESULT = int(os.getenv("RERANK_CANDIDATES_PER_RESULT", "5"))
+# Maximal marginal relevance trade-off: 0 ranks by relevance only, 1 by novelty only
+RERANK_DIVERSITY = float(os.getenv("RERANK_DIVERSITY", "0.0"))
+
+# How the subject's access scope restricts the vector search:
+# "join" - subquery over the materialized access table (planned by the database),
+# "in_list" - knowledge source ids sent as a parameter list.
+RETRIEVAL_ACCESS_FILTER = os.getenv("RETRIEVAL_ACCESS_FILTER", "join")
+
+# pgvector >= 0.8 only: keeps scanning the HNSW index until enough rows pass the
+# access filter ("relaxed_order" or "strict_order"). Empty disables it, which
+# also caps the shortlist of the first pass at 1000 query vectors (the largest
+# `hnsw.ef_search`), a limit large reranked requests reach.
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "")
+
+# Threads reading chunk files from the storage mount concurrently
+CHUNK_READER_THREADS = int(os.getenv("CHUNK_READER_THREADS", "16"))
+
+# Chunk bodies read ahead of the client by the streaming (NDJSON) retrieval
+CHUNK_STREAM_PREFETCH = int(os.getenv("CHUNK_STREAM_PREFETCH", "8"))
+
+# Embedding model of the new query vectors and of the queries (see `embedders`)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+# Upper bound on the texts embedded in one request, below the provider's limits
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# Models whose vectors are searched as well, while migrating to `EMBEDDING_MODEL`
+# (comma separated, see the `reembed_queries` command)
+EMBEDDING_DUAL_READ_MODELS = [
+    model for model in os.getenv("EMBEDDING_DUAL_READ_MODELS", "").split(",") if model
+]
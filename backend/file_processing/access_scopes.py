@@ -0,0 +1,191 @@
+"""
+Materialized "subject → accessible knowledge sources" scopes.
+
+Resolving the scope through casbin (`get_implicit_permissions_for_user` and
+parsing of every returned policy) is expensive, so the result is stored in the
+`KnowledgeSourceAccess` table and memoized in-process. Both are versioned with
+the `access_policy` generation, bumped on every policy change (by the casbin
+adapter, `PolicyAdapter`) and on creation or deletion of a `KnowledgeSource`. As the generation lives in the database,
+a change made through any instance invalidates the scopes on all of them.
+"""
+
+import logging
+from threading import RLock
+
+from content_access_control import core
+from content_access_control.adapter import Adapter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+
+from file_processing.caching import LRUCache
+from file_processing.generations import bump_generation, current_generation
+from file_processing.models import (
+    KnowledgeSource,
+    KnowledgeSourceAccess,
+    SubjectAccessScope,
+)
+from file_processing.timings import stage
+
+
+logger = logging.getLogger(__name__)
+
+ACCESS_POLICY_GENERATION = "access_policy"
+KNOWLEDGE_SOURCE_OBJECT_PREFIX = "file_processing:knowledgesource"
+
+# subject -> (generation, knowledge source ids), weighted by the number of ids
+memory_scopes = LRUCache(
+    settings.ACCESS_SCOPE_CACHE_MAX_IDS, weigh=lambda scope: len(scope[1]) + 1
+)
+# subject -> generation its materialized scope is known to be fresh at
+materialized_generations = LRUCache(settings.ACCESS_SCOPE_CACHE_MAX_SUBJECTS)
+# The enforcer is not thread-safe, and scopes are materialized on the threads
+# of the executor too (see `async_db.run_blocking`)
+_enforcer_lock = RLock()
+_enforcer_generation: int | None = None
+
+
+@stage("casbin")
+def policies_assigned_to_subject(subject_identifier: str) -> list[list[str]]:
+    """
+    Function that retrieves all permission policies assigned to a subject.
+
+    Args:
+        subject_identifier (str): The identifier of the subject. Could be
+        `unique_object_instance_identifier` if object implements the
+        ObjectIdentifierMixin, or simply a username, if the Django User object
+        is linked to a subject as it should.
+    """
+    if not isinstance(subject_identifier, str):
+        raise ValueError("subject_identifier must be a string")
+    policies = core.enforcer.get_implicit_permissions_for_user(subject_identifier)
+    return policies
+
+
+def subject_accessible_knowledge_sources(subject_identifier: str):
+    def filter_predicate(policy: list[str]):
+        return policy[1].startswith(KNOWLEDGE_SOURCE_OBJECT_PREFIX)
+
+    def get_knowledge_source_id(policy: list[str]):
+        return policy[1].split(":")[-1]
+
+    policies = policies_assigned_to_subject(subject_identifier)
+    filtered_policies = filter(filter_predicate, policies)
+    ks_ids = map(get_knowledge_source_id, filtered_policies)
+
+    return ks_ids
+
+
+def invalidate_access_scopes():
+    bump_generation(ACCESS_POLICY_GENERATION)
+
+
+class PolicyAdapter(Adapter):
+    """
+    The casbin adapter, invalidating the access scopes once per write to the
+    stored policies, whatever the number of rules it writes.
+    """
+
+    def save_policy(self, model):
+        with transaction.atomic(using=self.db_alias):
+            saved = super().save_policy(model)
+        invalidate_access_scopes()
+        return saved
+
+    def add_policy(self, sec, ptype, rule):
+        super().add_policy(sec, ptype, rule)
+        invalidate_access_scopes()
+
+    def remove_policy(self, sec, ptype, rule):
+        removed = super().remove_policy(sec, ptype, rule)
+        if removed:
+            invalidate_access_scopes()
+        return removed
+
+    def remove_filtered_policy(self, sec, ptype, field_index, *field_values):
+        removed = super().remove_filtered_policy(sec, ptype, field_index, *field_values)
+        if removed:
+            invalidate_access_scopes()
+        return removed
+
+
+def refresh_enforcer(generation: int):
+    """
+    Reloads the casbin policies if they were changed since this instance last
+    loaded them, possibly by another instance: the enforcer keeps them in memory.
+    The policies loaded at startup are of no known generation, so the first
+    scope materialized by the instance reloads them.
+    """
+    global _enforcer_generation
+    with _enforcer_lock:
+        if _enforcer_generation != generation:
+            core.enforcer.load_policy()
+            _enforcer_generation = generation
+
+
+def materialize_access_scope(subject: str, generation: int) -> frozenset[int]:
+    with _enforcer_lock:
+        refresh_enforcer(generation)
+        policy_ids = set(subject_accessible_knowledge_sources(subject))
+    # Policies may outlive the knowledge sources they were granted on
+    ks_ids = frozenset(
+        KnowledgeSource.objects.filter(pk__in=policy_ids).values_list("pk", flat=True)
+    )
+    with transaction.atomic():
+        KnowledgeSourceAccess.objects.filter(subject=subject).delete()
+        KnowledgeSourceAccess.objects.bulk_create(
+            [
+                KnowledgeSourceAccess(subject=subject, knowledge_source_id=ks_id)
+                for ks_id in ks_ids
+            ],
+            ignore_conflicts=True,
+        )
+        SubjectAccessScope.objects.update_or_create(
+            subject=subject, defaults={"generation": generation}
+        )
+    logger.info(f"Materialized access scope of {subject=} at {generation=}")
+    return ks_ids
+
+
+@stage("access_scope")
+def accessible_knowledge_source_ids(subject: str) -> frozenset[int]:
+    generation = current_generation(ACCESS_POLICY_GENERATION)
+    cached = memory_scopes.get(subject)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    is_materialized = SubjectAccessScope.objects.filter(
+        subject=subject, generation=generation
+    ).exists()
+    if is_materialized:
+        ks_ids = frozenset(
+            KnowledgeSourceAccess.objects.filter(subject=subject).values_list(
+                "knowledge_source_id", flat=True
+            )
+        )
+    else:
+        ks_ids = materialize_access_scope(subject, generation)
+
+    memory_scopes.set(subject, (generation, ks_ids))
+    return ks_ids
+
+
+@stage("access_scope")
+def materialized_access_scope(subject: str) -> QuerySet[KnowledgeSourceAccess]:
+    """
+    Ids of the knowledge sources the subject can access, as a subquery over the
+    materialized scope. Filtering with it keeps the ids in the database instead
+    of sending them back as a parameter list.
+    """
+    generation = current_generation(ACCESS_POLICY_GENERATION)
+    if materialized_generations.get(subject) != generation:
+        is_materialized = SubjectAccessScope.objects.filter(
+            subject=subject, generation=generation
+        ).exists()
+        if not is_materialized:
+            ks_ids = materialize_access_scope(subject, generation)
+            memory_scopes.set(subject, (generation, ks_ids))
+        materialized_generations.set(subject, generation)
+    return KnowledgeSourceAccess.objects.filter(subject=subject).values(
+        "knowledge_source_id"
+    )
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from .access_scopes import invalidate_access_scopes
 from .models import KnowledgeSource
 from content_access_control.admin_permission import register_permission_admin
+from content_access_control.models import CasbinRule
 
 
 @admin.register(KnowledgeSource)
@@ -8,3 +10,23 @@ class KnowledgeSourceAdmin(admin.ModelAdmin): ...
 
 
 register_permission_admin(KnowledgeSource, [])
+
+
+admin.site.unregister(CasbinRule)
+
+
+@admin.register(CasbinRule)
+class CasbinRuleAdmin(admin.ModelAdmin):
+    """Rules edited here bypass the casbin adapter, which invalidates the scopes"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_access_scopes()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_access_scopes()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_access_scopes()
@@ -0,0 +1,107 @@
+"""
+Non-blocking access to the default (PostgreSQL) database.
+
+Django's async ORM runs every query through `sync_to_async`, on a single shared
+thread, so concurrent requests would still queue up on it. The hot retrieval
+query is instead compiled by the ORM and executed on a psycopg async pool,
+connected and binding its parameters like Django does. The pool lives as long
+as the ASGI server (see `backend.asgi`); event loops without one, such as the
+short-lived loops of `async_to_sync`, open a connection per query.
+
+The other lookups of the hot path go through the ORM on `run_blocking`.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models.query import QuerySet
+from psycopg import AsyncClientCursor, AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+
+T = TypeVar("T")
+
+_pools: dict[asyncio.AbstractEventLoop, AsyncConnectionPool] = {}
+
+
+def connection_parameters() -> dict:
+    """
+    The parameters Django connects to the default database with (its `OPTIONS`
+    included), with its client-side parameter binding
+    """
+    parameters = connections["default"].get_connection_params()
+    parameters["cursor_factory"] = AsyncClientCursor
+    return parameters
+
+
+async def open_pool():
+    """Opens the pool of the running event loop, sized like the synchronous one"""
+    loop = asyncio.get_running_loop()
+    if connection.vendor != "postgresql" or loop in _pools:
+        return
+    options = settings.DATABASES["default"].get("OPTIONS", {}).get("pool", {})
+    pool = AsyncConnectionPool(
+        kwargs=connection_parameters(),
+        min_size=options.get("min_size", 1),
+        max_size=options.get("max_size", 20),
+        open=False,
+    )
+    _pools[loop] = pool
+    await pool.open()
+
+
+async def close_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+@asynccontextmanager
+async def database_connection() -> AsyncIterator[AsyncConnection]:
+    pool = _pools.get(asyncio.get_running_loop())
+    if pool is not None:
+        async with pool.connection() as pooled:
+            yield pooled
+        return
+    async with await AsyncConnection.connect(**connection_parameters()) as own:
+        yield own
+
+
+async def fetch_all(
+    queryset: QuerySet, configuration: dict[str, str] | None = None
+) -> list[dict]:
+    """
+    Evaluates a `.values()` queryset, with the given run-time parameters applied
+    for the duration of the query only (`SET LOCAL`).
+    """
+    sql, params = queryset.query.sql_with_params()
+    async with (
+        database_connection() as database,
+        database.transaction(),
+        database.cursor(row_factory=dict_row) as cursor,
+    ):
+        for name, value in (configuration or {}).items():
+            await cursor.execute("SELECT set_config(%s, %s, true)", [name, value])
+        await cursor.execute(sql, params)
+        return await cursor.fetchall()
+
+
+async def run_blocking(function: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Calls the (thread-safe) blocking function on a thread of the executor,
+    instead of the shared thread of `sync_to_async`. Its database connection is
+    released afterwards, as at the end of a request.
+    """
+
+    def call() -> T:
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(call, thread_sensitive=False)()
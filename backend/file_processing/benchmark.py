@@ -0,0 +1,298 @@
+"""
+Offline benchmark of the retrieval: a synthetic corpus with its access
+policies, an embedder standing in for the embedding API, and a runner timing
+`retrieve_relevant_queries_subject_filtered` and measuring its recall@k
+against an exact brute-force search.
+
+Works against any configured database: PostgreSQL with pgvector, or SQLite
+with the in-process vector index.
+"""
+
+import statistics
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+from content_access_control.models import CasbinRule
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.test.utils import override_settings
+
+from file_processing import utils, vector_index
+from file_processing.access_scopes import (
+    KNOWLEDGE_SOURCE_OBJECT_PREFIX,
+    accessible_knowledge_source_ids,
+    invalidate_access_scopes,
+)
+from file_processing.embedders import active_embedder
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+from file_processing.result_cache import invalidate_search_index
+
+
+BENCHMARK_OWNER = "benchmark-owner"
+BENCHMARK_SUBJECT_PREFIX = "benchmark-subject-"
+BENCHMARK_DIGEST_PREFIX = "benchmark-"
+WORDS = [
+    "cloud",
+    "network",
+    "storage",
+    "latency",
+    "replica",
+    "index",
+    "query",
+    "vector",
+    "policy",
+    "access",
+    "cluster",
+    "shard",
+    "backup",
+    "region",
+    "token",
+    "model",
+    "chunk",
+    "cache",
+    "scan",
+    "join",
+]
+
+
+def benchmark_subject(index: int) -> str:
+    return f"{BENCHMARK_SUBJECT_PREFIX}{index}"
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_embeddings(
+    rng: np.random.Generator, count: int, dimensions: int, clusters: int = 0
+) -> np.ndarray:
+    """Unit vectors, uniformly random, or spread around `clusters` centroids"""
+    if not clusters:
+        return unit_rows(rng.standard_normal((count, dimensions), dtype=np.float32))
+    centroids = unit_rows(rng.standard_normal((clusters, dimensions), np.float32))
+    noise = rng.standard_normal((count, dimensions), dtype=np.float32)
+    members = centroids[rng.integers(clusters, size=count)]
+    return unit_rows(members + noise * (0.5 / np.sqrt(dimensions)))
+
+
+def generate_corpus(
+    knowledge_sources: int,
+    chunks: int,
+    queries_per_chunk: int,
+    subjects: int,
+    access_fraction: float = 0.5,
+    clusters: int = 0,
+    seed: int = 0,
+    dimensions: int | None = None,
+):
+    """
+    Creates `chunks` chunks spread over the knowledge sources, each indexed by
+    `queries_per_chunk` query vectors, and grants every benchmark subject
+    access to a random `access_fraction` of the knowledge sources. The vectors
+    are stored as those of the active embedding model.
+    """
+    embedder = active_embedder()
+    dimensions = dimensions or embedder.dimensions
+    rng = np.random.default_rng(seed)
+    owner, _ = User.objects.get_or_create(username=BENCHMARK_OWNER)
+    with transaction.atomic():
+        sources = KnowledgeSource.objects.bulk_create(
+            KnowledgeSource(owner=owner, file=f"{BENCHMARK_OWNER}/{index}.pdf")
+            for index in range(knowledge_sources)
+        )
+        created_chunks = Chunk.objects.bulk_create(
+            Chunk(
+                knowledge_source=sources[index % knowledge_sources],
+                digest_hash=f"{BENCHMARK_DIGEST_PREFIX}{seed}-{index}",
+                file=f"benchmark/{seed}/{index}.json",
+                text=" ".join(rng.choice(WORDS, size=40)),
+            )
+            for index in range(chunks)
+        )
+        for start in range(0, chunks, 500):
+            batch = created_chunks[start : start + 500]
+            vectors = synthetic_embeddings(
+                rng, len(batch) * queries_per_chunk, dimensions, clusters
+            )
+            QueryVector.objects.bulk_create(
+                QueryVector(
+                    knowledge_source=chunk.knowledge_source,
+                    chunk=chunk,
+                    query=" ".join(rng.choice(WORDS, size=8)),
+                    vector=vectors[row].tolist(),
+                    embedding_model=embedder.model,
+                )
+                for row, chunk in enumerate(
+                    chunk for chunk in batch for _ in range(queries_per_chunk)
+                )
+            )
+        CasbinRule.objects.bulk_create(
+            CasbinRule(
+                ptype="p",
+                v0=benchmark_subject(subject),
+                v1=f"{KNOWLEDGE_SOURCE_OBJECT_PREFIX}:{source.pk}",
+                v2="access",
+            )
+            for subject in range(subjects)
+            for source in sources
+            if rng.random() < access_fraction
+        )
+    # The rules are written around the casbin adapter
+    invalidate_access_scopes()
+    invalidate_search_index()
+
+
+class FakeEmbedder:
+    """Stands in for the query embedding caches, with known query vectors"""
+
+    def __init__(self, embeddings: dict[str, list[float]]):
+        self.embeddings = embeddings
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        return [self.embeddings[text] for text in texts]
+
+    async def aembed_many(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_many(texts)
+
+
+@contextmanager
+def fake_embeddings(embedder: FakeEmbedder):
+    original = utils.query_embedding_cache
+    utils.query_embedding_cache = lambda model: embedder
+    try:
+        yield
+    finally:
+        utils.query_embedding_cache = original
+
+
+def benchmark_queries(count: int, seed: int = 0) -> dict[str, list[float]]:
+    """
+    Perturbed copies of random stored query vectors, as the fake embeddings:
+    those of the synthetic corpus, or of the whole index without one.
+    """
+    rng = np.random.default_rng(seed)
+    stored = QueryVector.objects.filter(embedding_model=active_embedder().model)
+    synthetic = stored.filter(chunk__digest_hash__startswith=BENCHMARK_DIGEST_PREFIX)
+    if synthetic.exists():
+        stored = synthetic
+    pks = list(stored.values_list("pk", flat=True))
+    picked = rng.choice(pks, size=min(count, len(pks)), replace=False).tolist()
+    vectors = QueryVector.objects.in_bulk(picked)
+    queries = {}
+    for index, pk in enumerate(picked):
+        vector = np.asarray(vectors[pk].vector, dtype=np.float32)
+        noise = rng.standard_normal(len(vector), dtype=np.float32)
+        perturbed = unit_rows((vector + noise * (0.2 / np.sqrt(len(vector))))[None])
+        queries[f"benchmark query {index}"] = perturbed[0].tolist()
+    return queries
+
+
+def exact_chunk_files(subject: str, embedding: list[float], top_k: int) -> set[str]:
+    """The ground truth: brute-force nearest chunks within the subject's access"""
+    ks_ids = accessible_knowledge_source_ids(subject)
+    hits = vector_index.nearest_chunks(ks_ids, [embedding], top_k)
+    return {hit["chunk__file"] for hit in hits}
+
+
+def percentile(samples: list[float], q: int) -> float:
+    if len(samples) < 2:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+@dataclass
+class BenchmarkReport:
+    queries: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    throughput: float
+    recall: float
+
+
+ACCESS_FILTERS = ["in_list", "join"]
+
+
+def run_benchmark(
+    queries: dict[str, list[float]],
+    subjects: list[str],
+    top_k: int,
+    threads: int = 1,
+    **retrieval_options,
+) -> BenchmarkReport:
+    """
+    Times the retrieval of every query, for the subjects in turn, with
+    `threads` concurrent clients and the result cache disabled.
+    """
+    work = [
+        (subjects[index % len(subjects)], text, embedding)
+        for index, (text, embedding) in enumerate(queries.items())
+    ]
+    for subject in subjects:
+        # The first call materializes the access scope, it is not timed
+        accessible_knowledge_source_ids(subject)
+
+    def timed(item: tuple[str, str, list[float]]) -> tuple[float, set[str]]:
+        subject, text, _ = item
+        try:
+            start = time.perf_counter()
+            chunks = utils.retrieve_relevant_queries_subject_filtered(
+                subject, text, top_k, **retrieval_options
+            )
+            return (time.perf_counter() - start) * 1000, {
+                chunk.file for chunk in chunks
+            }
+        finally:
+            if threads > 1:
+                close_old_connections()
+
+    with (
+        fake_embeddings(FakeEmbedder(queries)),
+        override_settings(RESULT_CACHE_MAX_CHARACTERS=0),
+    ):
+        start = time.perf_counter()
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(timed, work))
+        else:
+            results = [timed(item) for item in work]
+        wall_time = time.perf_counter() - start
+
+    recalls = []
+    for (subject, _, embedding), (_, found) in zip(work, results):
+        expected = exact_chunk_files(subject, embedding, top_k)
+        recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+    latencies = [latency for latency, _ in results]
+    return BenchmarkReport(
+        queries=len(results),
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        throughput=len(results) / wall_time,
+        recall=statistics.fmean(recalls),
+    )
+
+
+def run_configurations(
+    queries: dict[str, list[float]],
+    subjects: list[str],
+    top_k: int,
+    first_passes: list[str],
+    access_filters: list[str],
+    threads: int = 1,
+    **retrieval_options,
+) -> Iterator[tuple[str, str, BenchmarkReport]]:
+    """`run_benchmark` with every first pass index and access filter in turn"""
+    for first_pass, access_filter in product(first_passes, access_filters):
+        with override_settings(
+            RETRIEVAL_FIRST_PASS=first_pass, RETRIEVAL_ACCESS_FILTER=access_filter
+        ):
+            report = run_benchmark(
+                queries, subjects, top_k, threads, **retrieval_options
+            )
+        yield first_pass, access_filter, report
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total weight of its
+    entries. By default every entry weighs 1, which bounds the entry count.
+    """
+
+    def __init__(self, max_weight: int, weigh: Callable[[Any], int] = lambda _: 1):
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        weight = self.weigh(value)
+        if weight > self.max_weight:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[1]
+            self._entries[key] = (value, weight)
+            self.weight += weight
+            while self.weight > self.max_weight:
+                _, (_, evicted_weight) = self._entries.popitem(last=False)
+                self.weight -= evicted_weight
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
@@ -0,0 +1,61 @@
+"""
+Reuse of the generated queries and vectors of chunks already indexed.
+
+Chunks are identified by the digest of their content, so the same section
+uploaded again, or shared by several documents, has the same digest under
+every knowledge source. Instead of generating and embedding its queries
+again, a new chunk gets copies of the query vectors of an indexed chunk with
+its digest. The copies belong to the new chunk's knowledge source, so the
+retrieval applies its access policies to them like to any other vector.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from file_processing.models import Chunk, QueryVector
+from file_processing.result_cache import invalidate_search_index
+
+
+logger = logging.getLogger(__name__)
+
+
+def indexed_twin(chunk: Chunk, embedding_model: str) -> Chunk | None:
+    """Another chunk with the same digest, whose queries are embedded with the model"""
+    embedded = QueryVector.objects.filter(
+        chunk=OuterRef("pk"), embedding_model=embedding_model
+    )
+    return (
+        Chunk.objects.filter(digest_hash=chunk.digest_hash)
+        .exclude(pk=chunk.pk)
+        .filter(Exists(embedded))
+        .order_by("pk")
+        .first()
+    )
+
+
+def twin_vectors(chunk: Chunk, twin: Chunk) -> list[QueryVector]:
+    """Copies of the query vectors of the twin, of every model, for the chunk"""
+    rows = QueryVector.objects.filter(chunk=twin).values(
+        "query", "vector", "embedding_model"
+    )
+    return [
+        QueryVector(**row, knowledge_source_id=chunk.knowledge_source_id, chunk=chunk)
+        for row in rows
+    ]
+
+
+def reuse_indexed_twin(chunk: Chunk, embedding_model: str) -> bool:
+    """
+    Copies the query vectors of an indexed twin of the chunk, of every model,
+    to the chunk. Returns whether there was a twin to copy from.
+    """
+    twin = indexed_twin(chunk, embedding_model)
+    if twin is None:
+        return False
+    with transaction.atomic():
+        QueryVector.objects.bulk_create(twin_vectors(chunk, twin), batch_size=1000)
+    invalidate_search_index()
+    logger.info(f"Reused the queries of chunk {twin.pk} for chunk {chunk.pk}")
+    return True
@@ -0,0 +1,124 @@
+"""
+Registry of the embedding models the query vectors can be written with.
+
+Every `QueryVector` records the model of its vector, and the retrieval only
+compares a query with the vectors of the model it was embedded with. New
+vectors are written with the active model (`EMBEDDING_MODEL`). While the
+stored vectors are re-embedded into a new model (see `reembedding`), the
+models of `EMBEDDING_DUAL_READ_MODELS` are searched as well.
+"""
+
+from dataclasses import dataclass
+from functools import cache, partial
+
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+from file_processing.embedding_cache import (
+    ASYNC_EMBED_FUNCTION_T,
+    EMBED_FUNCTION_T,
+    EmbeddingCache,
+)
+
+
+def embed_content(
+    content: str | list[str], model: str = "text-embedding-3-large"
+) -> list[list[float] | None]:
+    client = OpenAI()
+
+    response = client.embeddings.create(input=content, model=model)
+    data = response.data
+    return [embedding.embedding for embedding in data]
+
+
+@cache
+def async_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI()
+
+
+async def aembed_content(
+    content: str | list[str], model: str = "text-embedding-3-large"
+) -> list[list[float] | None]:
+    response = await async_openai_client().embeddings.create(input=content, model=model)
+    data = response.data
+    return [embedding.embedding for embedding in data]
+
+
+def embed_content_gemini(
+    content: str | list[str], model: str = "gemini-embedding-001"
+) -> list[list[float] | None]:
+    from google import genai
+
+    client = genai.Client()
+    result = client.models.embed_content(model=model, contents=content)
+    data = result.embeddings
+    return [embedding.values for embedding in data]
+
+
+@dataclass(frozen=True)
+class Embedder:
+    model: str
+    dimensions: int
+    embed: EMBED_FUNCTION_T
+    aembed: ASYNC_EMBED_FUNCTION_T | None = None
+    # Inputs the provider accepts in one request
+    max_batch_size: int = 2048
+
+
+def openai_embedder(model: str, dimensions: int) -> Embedder:
+    return Embedder(
+        model,
+        dimensions,
+        partial(embed_content, model=model),
+        partial(aembed_content, model=model),
+    )
+
+
+EMBEDDERS: dict[str, Embedder] = {
+    "text-embedding-3-large": openai_embedder("text-embedding-3-large", 3072),
+    "text-embedding-3-small": openai_embedder("text-embedding-3-small", 1536),
+    "gemini-embedding-001": Embedder(
+        "gemini-embedding-001", 3072, embed_content_gemini, max_batch_size=100
+    ),
+}
+
+
+def embedder(model: str) -> Embedder:
+    if model not in EMBEDDERS:
+        raise ValueError(f"Unknown embedding model {model=}, one of {list(EMBEDDERS)}")
+    return EMBEDDERS[model]
+
+
+def active_embedder() -> Embedder:
+    return embedder(settings.EMBEDDING_MODEL)
+
+
+def read_embedders() -> list[Embedder]:
+    """The models the retrieval searches the vectors of, the active one first"""
+    models = dict.fromkeys(
+        [settings.EMBEDDING_MODEL, *settings.EMBEDDING_DUAL_READ_MODELS]
+    )
+    return [embedder(model) for model in models]
+
+
+def embed_in_batches(embedder: Embedder, texts: list[str]) -> list[list[float]]:
+    """Embeds the texts in as few requests as the provider's batch limit allows"""
+    batch_size = min(embedder.max_batch_size, settings.EMBEDDING_BATCH_SIZE)
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        embeddings += embedder.embed(texts[start : start + batch_size])
+    return embeddings
+
+
+# Query embedding caches of the process, by model
+query_embedding_caches: dict[str, EmbeddingCache] = {}
+
+
+def query_embedding_cache(model: str) -> EmbeddingCache:
+    if model not in query_embedding_caches:
+        query_embedder = embedder(model)
+        query_embedding_caches.setdefault(
+            model,
+            EmbeddingCache(query_embedder.embed, model, query_embedder.aembed),
+        )
+    return query_embedding_caches[model]
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import unicodedata
+from collections import Counter
+from threading import Lock
+from typing import Awaitable, Callable
+
+from django.conf import settings
+from django.utils import timezone
+
+from file_processing import async_db
+from file_processing.caching import LRUCache
+from file_processing.models import CachedEmbedding
+
+
+logger = logging.getLogger(__name__)
+
+EMBED_FUNCTION_T = Callable[[list[str]], list[list[float]]]
+ASYNC_EMBED_FUNCTION_T = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a query: NFKC, with whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(embedding_model: str, normalized_text: str) -> str:
+    return hashlib.sha256(f"{embedding_model}\0{normalized_text}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by (model, normalized text).
+
+    The in-process LRU tier answers repeated queries without any I/O; the
+    shared tier (`CachedEmbedding` table) is visible to every instance and is
+    trimmed to `EMBEDDING_CACHE_SHARED_ENTRIES` least recently used rows.
+    Only the misses of both tiers are sent to the embedding API, in one call.
+    """
+
+    def __init__(
+        self,
+        embed: EMBED_FUNCTION_T,
+        embedding_model: str,
+        aembed: ASYNC_EMBED_FUNCTION_T | None = None,
+    ):
+        self.embed_function = embed
+        self.aembed_function = aembed
+        self.embedding_model = embedding_model
+        self.memory = LRUCache(settings.EMBEDDING_CACHE_MEMORY_ENTRIES)
+        self.counters = Counter()
+        self._lock = Lock()
+        self._inserts_since_eviction = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "memory_hits": self.counters["memory_hits"],
+                "shared_hits": self.counters["shared_hits"],
+                "misses": self.counters["misses"],
+                "memory_entries": len(self.memory),
+            }
+
+    def _count(self, counter: str, amount: int):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def embed(self, text: str) -> list[float]:
+        [embedding] = self.embed_many([text])
+        return embedding
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        keys, texts_by_key, found = self._lookup(texts)
+        missing = self._missing(texts_by_key, found)
+        if missing:
+            self._found_shared(found, self._shared_get(list(missing)))
+
+        to_embed = self._missing(texts_by_key, found)
+        if to_embed:
+            self._count("misses", len(to_embed))
+            embeddings = self.embed_function(list(to_embed.values()))
+            self._shared_set(self._found_computed(found, to_embed, embeddings))
+
+        return [found[key] for key in keys]
+
+    async def aembed(self, text: str) -> list[float]:
+        [embedding] = await self.aembed_many([text])
+        return embedding
+
+    async def aembed_many(self, texts: list[str]) -> list[list[float]]:
+        """
+        `embed_many` for the event loop: the embedding API is awaited, and the
+        shared tier is queried on a thread of the executor.
+        """
+        if self.aembed_function is None:
+            return await async_db.run_blocking(self.embed_many, texts)
+        keys, texts_by_key, found = self._lookup(texts)
+        missing = self._missing(texts_by_key, found)
+        if missing:
+            shared = await async_db.run_blocking(self._shared_get, list(missing))
+            self._found_shared(found, shared)
+
+        to_embed = self._missing(texts_by_key, found)
+        if to_embed:
+            self._count("misses", len(to_embed))
+            embeddings = await self.aembed_function(list(to_embed.values()))
+            computed = self._found_computed(found, to_embed, embeddings)
+            await async_db.run_blocking(self._shared_set, computed)
+
+        return [found[key] for key in keys]
+
+    def _lookup(
+        self, texts: list[str]
+    ) -> tuple[list[str], dict[str, str], dict[str, list[float]]]:
+        """Keys of the texts, their normalized text by key, and those in memory"""
+        normalized = [normalize_text(text) for text in texts]
+        keys = [cache_key(self.embedding_model, text) for text in normalized]
+        return keys, dict(zip(keys, normalized)), self._memory_get(keys)
+
+    @staticmethod
+    def _missing(
+        texts_by_key: dict[str, str], found: dict[str, list[float]]
+    ) -> dict[str, str]:
+        return {key: text for key, text in texts_by_key.items() if key not in found}
+
+    def _found_shared(
+        self, found: dict[str, list[float]], shared: dict[str, list[float]]
+    ):
+        self._count("shared_hits", len(shared))
+        found.update(self._remember(shared))
+
+    def _found_computed(
+        self,
+        found: dict[str, list[float]],
+        to_embed: dict[str, str],
+        embeddings: list[list[float]],
+    ) -> dict[str, list[float]]:
+        computed = self._remember(dict(zip(to_embed, embeddings)))
+        found.update(computed)
+        return computed
+
+    def _memory_get(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        for key in keys:
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                found[key] = embedding
+        self._count("memory_hits", len(found))
+        return found
+
+    def _remember(self, embeddings: dict[str, list[float]]) -> dict[str, list[float]]:
+        for key, embedding in embeddings.items():
+            self.memory.set(key, embedding)
+        return embeddings
+
+    def _shared_get(self, keys: list[str]) -> dict[str, list[float]]:
+        rows = CachedEmbedding.objects.filter(pk__in=keys).values_list("pk", "vector")
+        found = dict(rows)
+        if found:
+            CachedEmbedding.objects.filter(pk__in=found.keys()).update(
+                last_used_at=timezone.now()
+            )
+        return found
+
+    def _shared_set(self, embeddings: dict[str, list[float]]):
+        now = timezone.now()
+        CachedEmbedding.objects.bulk_create(
+            [
+                CachedEmbedding(
+                    key=key,
+                    embedding_model=self.embedding_model,
+                    vector=embedding,
+                    last_used_at=now,
+                )
+                for key, embedding in embeddings.items()
+            ],
+            ignore_conflicts=True,
+        )
+        with self._lock:
+            self._inserts_since_eviction += len(embeddings)
+            due = (
+                self._inserts_since_eviction
+                >= settings.EMBEDDING_CACHE_EVICTION_INTERVAL
+            )
+            if due:
+                self._inserts_since_eviction = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Trims the shared tier down to its least recently used entries"""
+        stale = CachedEmbedding.objects.order_by("-last_used_at").values("pk")[
+            settings.EMBEDDING_CACHE_SHARED_ENTRIES :
+        ]
+        deleted, _ = CachedEmbedding.objects.filter(pk__in=stale).delete()
+        if deleted:
+            logger.info(f"Evicted {deleted} entries from the shared embedding cache")
+
+
+def prometheus_lines(caches: dict[str, EmbeddingCache]) -> list[str]:
+    """The `stats` of the caches, by model, in the Prometheus text format"""
+    lines = [
+        "# HELP embedding_cache_lookups_total Query embedding cache lookups",
+        "# TYPE embedding_cache_lookups_total counter",
+    ]
+    stats = {model: cache.stats() for model, cache in sorted(caches.items())}
+    for model, cache_stats in stats.items():
+        for result in ("memory_hits", "shared_hits", "misses"):
+            lines.append(
+                f'embedding_cache_lookups_total{{model="{model}",result="{result}"}} '
+                f"{cache_stats[result]}"
+            )
+    lines += [
+        "# HELP embedding_cache_memory_entries Entries of the in-process tier",
+        "# TYPE embedding_cache_memory_entries gauge",
+    ]
+    for model, cache_stats in stats.items():
+        lines.append(
+            f'embedding_cache_memory_entries{{model="{model}"}} '
+            f"{cache_stats['memory_entries']}"
+        )
+    return lines
@@ -0,0 +1,16 @@
+from django.db.models import F
+
+from file_processing.models import Generation
+
+
+def current_generation(name: str) -> int:
+    value = Generation.objects.filter(name=name).values_list("value", flat=True)
+    return value.first() or 0
+
+
+def bump_generation(name: str):
+    """Atomically increments the counter, visible to every instance at once"""
+    updated = Generation.objects.filter(name=name).update(value=F("value") + 1)
+    if not updated:
+        Generation.objects.get_or_create(name=name)
+        Generation.objects.filter(name=name).update(value=F("value") + 1)
@@ -1,4 +1,10 @@
 import asyncio
+import atexit
+import logging
+import threading
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from django.conf import settings
 from fast_agent import FastAgent
 from pydantic import BaseModel
 from typing import Any, Callable
@@ -13,6 +19,9 @@ XML_FORMATTER = Callable[
 ]
 
 
+logger = logging.getLogger(__name__)
+
+
 class Questions(BaseModel):
     questions: list[str]
 
@@ -31,12 +40,8 @@ COMMON_REQUIREMENTS = """_search queries_ that should satisfy all of the followi
 Examples of BAD query: "What are the specific benefits that cloud computing provides to businesses?"
 Examples of GOOD query: "cloud computing benefits" """
 
-query_gen_agent = FastAgent("Evaluator-Optimizer")
-
 
-@query_gen_agent.agent(
-    name="generator",
-    instruction=f"""Think of search queries that real users would type when
+GENERATOR_INSTRUCTION = f"""Think of search queries that real users would type when
     looking for information covered in this section. Think like a search engine
     user - short, keyword-focused, natural language queries. Write
     {COMMON_REQUIREMENTS}
@@ -48,12 +53,9 @@ query_gen_agent = FastAgent("Evaluator-Optimizer")
     typically)
 
     The queries should feel natural and be the kind of thing someone would type into
-    a search box when looking for this information.""",
-    use_history=True,
-)
-@query_gen_agent.agent(
-    name="evaluator",
-    instruction=f"""You are an expert at evaluating search query quality for RAG systems.
+    a search box when looking for this information."""
+
+EVALUATOR_INSTRUCTION = f"""You are an expert at evaluating search query quality for RAG systems.
 
     You are given:
     1) The original section content
@@ -64,19 +66,208 @@ query_gen_agent = FastAgent("Evaluator-Optimizer")
     Rate the overall set as: EXCELLENT, GOOD, FAIR, or POOR
 
     Focus on whether these queries would have high semantic similarity to actual
-    user searches while still being answerable by the content.""",
-)
-@query_gen_agent.evaluator_optimizer(
-    name="query_refiner",
-    generator="generator",
-    evaluator="evaluator",
-    min_rating="EXCELLENT",
-    max_refinements=3,
-)
+    user searches while still being answerable by the content."""
+
+
+def build_query_gen_agent() -> FastAgent:
+    """The query refiner: the generator and the evaluator agents, in a loop"""
+    agent = FastAgent("Evaluator-Optimizer")
+
+    @agent.agent(
+        name="generator",
+        instruction=GENERATOR_INSTRUCTION,
+        use_history=True,
+    )
+    @agent.agent(
+        name="evaluator",
+        instruction=EVALUATOR_INSTRUCTION,
+    )
+    @agent.evaluator_optimizer(
+        name="query_refiner",
+        generator="generator",
+        evaluator="evaluator",
+        min_rating="EXCELLENT",
+        max_refinements=3,
+    )
+    async def query_refiner():
+        pass
+
+    return agent
+
+
+query_gen_agent = build_query_gen_agent()
+
+
+async def structured_queries(agent, text) -> Questions | None:
+    questions, _ = await agent.query_refiner.structured(text, Questions)
+    return questions
+
+
 async def generate_queries(text) -> Questions | None:
+    """One-off generation, starting (and stopping) an app of its own"""
     async with query_gen_agent.run() as agent:
-        questions, _ = await agent.query_refiner.structured(text, Questions)
-        return questions
+        return await structured_queries(agent, text)
+
+
+def clear_history(agent):
+    """
+    Forgets the previous generation of a reused app: the generator keeps its
+    conversation (`use_history`), so its refinements see their previous rounds.
+    fast-agent has no reset of its own: both histories of the LLMs are cleared,
+    through the attributes `test_query_generation` checks on the pinned version.
+    """
+    for name in ("generator", "evaluator"):
+        llm = agent[name].llm
+        llm.history.clear()
+        llm.message_history.clear()
+
+
+class AgentSessionPool:
+    """
+    Running apps of the query refiner, started on first use and reused by all
+    the generations of the process, instead of starting an app (loading the
+    config, the agents and their LLM clients) for every chunk.
+
+    The apps live on an event loop of their own thread: every generation is
+    submitted to it with `run`. `close` stops them, at exit at the latest.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def run(self, coroutine):
+        """Runs the coroutine on the loop of the apps, and returns its result"""
+        with self._lock:
+            if self._loop is None:
+                self._start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever, name="query-generation", daemon=True
+        )
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+        except BaseException:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            raise
+        self._loop, self._thread = loop, thread
+        atexit.register(self.close)
+        logger.info(f"Started {self.size} query generation sessions")
+
+    async def _open(self):
+        self._stack = AsyncExitStack()
+        self._idle: asyncio.Queue = asyncio.Queue()
+        try:
+            for _ in range(self.size):
+                agent = build_query_gen_agent()
+                self._idle.put_nowait(
+                    await self._stack.enter_async_context(agent.run())
+                )
+        except BaseException:
+            await self._stack.aclose()
+            raise
+
+    @asynccontextmanager
+    async def session(self):
+        """An idle app, with a fresh history; waits for one if all are busy"""
+        agent = await self._idle.get()
+        try:
+            clear_history(agent)
+            yield agent
+        finally:
+            self._idle.put_nowait(agent)
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(
+                    self._stack.aclose(), self._loop
+                ).result()
+            finally:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop, self._thread = None, None
+            atexit.unregister(self.close)
+            logger.info("Stopped the query generation sessions")
+
+
+session_pool = AgentSessionPool(settings.QUERY_GENERATION_SESSIONS)
+
+
+def is_rate_limited(error: BaseException | None) -> bool:
+    """Whether the error, or one it was raised from, is a provider's HTTP 429"""
+    while error is not None:
+        if getattr(error, "status_code", None) == 429:
+            return True
+        if type(error).__name__ == "RateLimitError":
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class RateLimiter:
+    """
+    Bounds the concurrent generations, and pauses all of them for a while once
+    the provider answers one with a rate limit error.
+    """
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.resume_at = 0.0
+
+    async def wait(self):
+        while (delay := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def back_off(self, seconds: float):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+async def generate_queries_limited(text, limiter: RateLimiter) -> Questions | None:
+    for attempt in range(settings.QUERY_GENERATION_MAX_RETRIES + 1):
+        async with limiter.semaphore:
+            await limiter.wait()
+            try:
+                async with session_pool.session() as agent:
+                    return await structured_queries(agent, text)
+            except Exception as e:
+                if (
+                    not is_rate_limited(e)
+                    or attempt == settings.QUERY_GENERATION_MAX_RETRIES
+                ):
+                    raise
+                delay = settings.QUERY_GENERATION_BACKOFF * 2**attempt
+                logger.warning(f"Rate limited, retrying in {delay}s ({attempt=})")
+                limiter.back_off(delay)
+
+
+async def agenerate_queries_many(texts: list) -> list[Questions | None]:
+    """
+    Generates the queries of all the texts on one event loop, at most
+    `QUERY_GENERATION_CONCURRENCY` at a time. A text whose generation fails
+    gets None, the others are kept.
+    """
+    limiter = RateLimiter(settings.QUERY_GENERATION_CONCURRENCY)
+    results = await asyncio.gather(
+        *(generate_queries_limited(text, limiter) for text in texts),
+        return_exceptions=True,
+    )
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to generate the queries of text {index}: {result!r}")
+            results[index] = None
+    return results
 
 
 class QueryGenerator:
@@ -86,4 +277,9 @@ class QueryGenerator:
     def __call__(self, section: SECTION_DICT_T) -> Questions | None:
         """Generate search queries for a given section."""
         section_digest = self.xml_formatter(section)
-        return asyncio.run(generate_queries(section_digest))
+        return session_pool.run(agenerate_queries_many([section_digest]))[0]
+
+    def generate_many(self, sections: list[SECTION_DICT_T]) -> list[Questions | None]:
+        """Generate the search queries of all the sections of a document, concurrently."""
+        section_digests = [self.xml_formatter(section) for section in sections]
+        return session_pool.run(agenerate_queries_many(section_digests))
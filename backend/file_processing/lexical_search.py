@@ -0,0 +1,113 @@
+"""
+Lexical (full-text) retrieval, fused with the vector search by reciprocal rank
+fusion.
+
+Dense retrieval tends to miss exact identifiers, error codes and product names,
+which full-text search matches verbatim. On PostgreSQL the chunk text and the
+generated queries are searched through GIN indexes (see migration 0015);
+elsewhere a plain substring match is used.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Max, Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from file_processing.models import Chunk, QueryVector
+
+
+# Must match the indexed expressions of migration 0015
+CHUNK_DOCUMENT = (
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(text, ''))"
+)
+QUERY_DOCUMENT = "to_tsvector('simple', query)"
+TEXT_QUERY = "websearch_to_tsquery('simple', %s)"
+
+RETRIEVAL_MODES = ["auto", "vector", "lexical", "hybrid"]
+
+# A single token with digits, separators or inner capitals: `ERR_SSL_PROTOCOL`,
+# `0x80070005`, `getUserById`, `v2.3.1`, `pkg/module`
+IDENTIFIER = re.compile(r"^(?=\S*([0-9_./:#@-]|[a-z][A-Z]))\S+$")
+
+
+def looks_like_identifier(query: str) -> bool:
+    return bool(IDENTIFIER.match(query.strip()))
+
+
+def retrieval_mode(query: str, mode: str | None = None) -> str:
+    """
+    "vector", "lexical" or "hybrid". The "auto" mode skips the embedding for
+    identifier-like queries, which only the lexical search can match anyway.
+    """
+    mode = mode or settings.RETRIEVAL_MODE
+    if mode == "auto":
+        return "lexical" if looks_like_identifier(query) else "hybrid"
+    return mode
+
+
+def text_match(document: str, query: str) -> RawSQL:
+    return RawSQL(f"{document} @@ {TEXT_QUERY}", [query], output_field=BooleanField())
+
+
+def text_rank(document: str, query: str) -> RawSQL:
+    return RawSQL(
+        f"ts_rank_cd({document}, {TEXT_QUERY})", [query], output_field=FloatField()
+    )
+
+
+def lexical_rankings(knowledge_source_ids, query: str, limit: int) -> list[QuerySet]:
+    """
+    Chunks of the given knowledge sources matching `query`, best first: by
+    their own text, and by the generated queries indexing them. The rows are
+    normalized with `as_hits`.
+    """
+    # Without the unresolved chunks of legacy vectors (see migration 0011)
+    chunks = Chunk.objects.filter(
+        knowledge_source__id__in=knowledge_source_ids
+    ).exclude(file="")
+    queries = QueryVector.objects.filter(
+        knowledge_source__id__in=knowledge_source_ids
+    ).exclude(chunk__file="")
+    if connection.vendor != "postgresql":
+        chunks = chunks.filter(Q(title__icontains=query) | Q(text__icontains=query))
+        queries = queries.filter(query__icontains=query)
+        return [
+            chunks.values("id", "file", "text")[:limit],
+            queries.values("chunk_id", "chunk__file", "chunk__text").distinct()[:limit],
+        ]
+    return [
+        chunks.filter(text_match(CHUNK_DOCUMENT, query))
+        .annotate(rank=text_rank(CHUNK_DOCUMENT, query))
+        .order_by("-rank")
+        .values("id", "file", "text")[:limit],
+        queries.filter(text_match(QUERY_DOCUMENT, query))
+        .values("chunk_id", "chunk__file", "chunk__text")
+        .annotate(rank=Max(text_rank(QUERY_DOCUMENT, query)))
+        .order_by("-rank")[:limit],
+    ]
+
+
+def as_hits(rows: list[dict]) -> list[dict]:
+    return [
+        {
+            "chunk_id": row.get("chunk_id", row.get("id")),
+            "chunk__file": row.get("chunk__file", row.get("file")),
+            "chunk__text": row.get("chunk__text", row.get("text")),
+        }
+        for row in rows
+    ]
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], top_k: int) -> list[dict]:
+    """
+    Merges rankings of chunk hits by their reciprocal rank fusion score,
+    sum(1 / (RETRIEVAL_RRF_K + rank)), returned as the hits' "score".
+    """
+    fused: dict[int, dict] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            entry = fused.setdefault(hit["chunk_id"], {**hit, "score": 0.0})
+            entry["score"] += 1 / (settings.RETRIEVAL_RRF_K + rank)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)[:top_k]
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+
+from file_processing.benchmark import (
+    ACCESS_FILTERS,
+    benchmark_queries,
+    benchmark_subject,
+    run_configurations,
+)
+from file_processing.lexical_search import RETRIEVAL_MODES
+from file_processing.utils import (
+    FIRST_PASS_DISTANCES,
+    effective_ef_search,
+    filter_queries_by_subject_access,
+    rank_chunks_by_relevance,
+    vector_search_accuracy,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the latency, throughput and recall@k of the access filtered "
+        "retrieval of the given subjects, or of the corpus of "
+        "generate_benchmark_corpus, with every first pass index and access filter"
+    )
+
+    def add_arguments(self, parser):
+        # The subjects of generate_benchmark_corpus when none is given
+        parser.add_argument("subjects", nargs="*")
+        parser.add_argument("--benchmark-subjects", type=int, default=10)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--top-k", type=int, default=20)
+        parser.add_argument("--threads", type=int, default=1)
+        parser.add_argument("--ef-search", type=int)
+        parser.add_argument("--mode", choices=RETRIEVAL_MODES, default="vector")
+        parser.add_argument(
+            "--first-pass",
+            choices=list(FIRST_PASS_DISTANCES),
+            nargs="+",
+            default=list(FIRST_PASS_DISTANCES),
+        )
+        parser.add_argument(
+            "--access-filter",
+            choices=ACCESS_FILTERS,
+            nargs="+",
+            default=ACCESS_FILTERS,
+        )
+        parser.add_argument("--explain", action="store_true")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, subjects, top_k, **options):
+        subjects = subjects or [
+            benchmark_subject(index) for index in range(options["benchmark_subjects"])
+        ]
+        queries = benchmark_queries(options["queries"], options["seed"])
+        configurations = run_configurations(
+            queries,
+            subjects,
+            top_k,
+            options["first_pass"],
+            options["access_filter"],
+            options["threads"],
+            ef_search=options["ef_search"],
+            mode=options["mode"],
+        )
+        for first_pass, access_filter, report in configurations:
+            self.stdout.write(
+                f"{first_pass=} {access_filter=} queries={report.queries}: "
+                f"p50={report.p50_ms:.1f}ms p95={report.p95_ms:.1f}ms "
+                f"p99={report.p99_ms:.1f}ms "
+                f"throughput={report.throughput:.1f}/s "
+                f"recall@{top_k}={report.recall:.3f}"
+            )
+            if options["explain"]:
+                ranked = rank_chunks_by_relevance(
+                    filter_queries_by_subject_access(subjects[0], access_filter),
+                    next(iter(queries.values())),
+                    top_k,
+                    first_pass,
+                )
+                ef_search = effective_ef_search(top_k, options["ef_search"])
+                with vector_search_accuracy(ef_search):
+                    self.stdout.write(ranked.explain(analyze=True))
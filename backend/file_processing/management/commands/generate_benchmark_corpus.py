@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from file_processing.benchmark import generate_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a synthetic corpus of knowledge sources, chunks and query "
+        "vectors, with access policies for the benchmark subjects"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--knowledge-sources", type=int, default=100)
+        parser.add_argument("--chunks", type=int, default=10_000)
+        parser.add_argument("--queries-per-chunk", type=int, default=5)
+        parser.add_argument("--subjects", type=int, default=10)
+        parser.add_argument("--access-fraction", type=float, default=0.5)
+        # 0 for uniformly random embeddings
+        parser.add_argument("--clusters", type=int, default=0)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        generate_corpus(
+            options["knowledge_sources"],
+            options["chunks"],
+            options["queries_per_chunk"],
+            options["subjects"],
+            options["access_fraction"],
+            options["clusters"],
+            options["seed"],
+        )
+        self.stdout.write(
+            f"Created {options['chunks']} chunks in "
+            f"{options['knowledge_sources']} knowledge sources"
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from file_processing.views.eventarc import process_file_to_sections
+
+
+class Command(BaseCommand):
+    help = (
+        "Extracts, chunks and indexes an uploaded file in one job, with the "
+        "direct ingestion pipeline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "object_name", help="Path of the upload, relative to PRIVATE_MOUNT"
+        )
+
+    def handle(self, *args, object_name, **options):
+        chunks = process_file_to_sections(object_name, pipeline="direct")
+        if chunks is None:
+            self.stderr.write(f"Failed to ingest {object_name=}")
+            return
+        self.stdout.write(f"Ingested {len(chunks)} chunks of {object_name=}")
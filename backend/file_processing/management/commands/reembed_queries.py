@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from file_processing.embedders import EMBEDDERS, embedder
+from file_processing.reembedding import (
+    create_ann_indexes,
+    delete_vectors,
+    pending_queries,
+    reembed_batch,
+    unembeddable_queries,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embeds the generated queries of the source model into the target "
+        "model, in batches; resumable (see `file_processing.reembedding`)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", choices=list(EMBEDDERS))
+        parser.add_argument("target", choices=list(EMBEDDERS))
+        parser.add_argument("--batch-size", type=int, default=256)
+        # Pause between the batches, in seconds, to stay within the rate limits
+        parser.add_argument("--pause", type=float, default=0.0)
+        parser.add_argument("--skip-indexes", action="store_true")
+        parser.add_argument(
+            "--delete-source",
+            action="store_true",
+            help="Delete the source vectors once all are re-embedded",
+        )
+
+    def handle(self, *args, source, target, batch_size, pause, **options):
+        target_embedder = embedder(target)
+        if not options["skip_indexes"]:
+            create_ann_indexes(target_embedder)
+
+        total = 0
+        while done := reembed_batch(source, target_embedder, batch_size):
+            total += done
+            self.stdout.write(f"Re-embedded {total} queries into {target=}")
+            time.sleep(pause)
+
+        if options["delete_source"]:
+            if pending_queries(source, target).exists():
+                self.stderr.write("Some queries are still pending, nothing deleted")
+                return
+            if unembeddable := unembeddable_queries(source).count():
+                self.stderr.write(
+                    f"{unembeddable} vectors of {source=} have no query text and "
+                    "cannot be re-embedded, nothing deleted. Upload their "
+                    "knowledge sources again to index them with the target model."
+                )
+                return
+            deleted = delete_vectors(source, batch_size)
+            self.stdout.write(f"Deleted {deleted} vectors of {source=}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+import file_processing.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0005_alter_queryvector_file"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="queryvector",
+            name="vector",
+            field=file_processing.models.VectorField(dimensions=3072, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# pgvector caps HNSW indexes on `vector` columns at 2000 dimensions, while
+# text-embedding-3-large produces 3072. The index is therefore built over the
+# `halfvec` cast of the column (limit: 4000 dimensions), and the retrieval query
+# orders by the very same expression so that the planner can use it.
+INDEX_NAME = "file_processing_queryvector_vector_hnsw"
+
+
+def forwards_func(apps, schema_editor):
+    """Only build the ANN index on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} "
+        "ON file_processing_queryvector "
+        "USING hnsw ((vector::halfvec(3072)) halfvec_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64);"
+    )
+
+
+def reverse_func(apps, schema_editor):
+    """Only drop the ANN index on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME};")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("file_processing", "0006_alter_queryvector_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:02
+
+import file_processing.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0007_queryvector_vector_hnsw_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedEmbedding",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("embedding_model", models.CharField(max_length=255)),
+                ("vector", file_processing.models.VectorField()),
+                ("last_used_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
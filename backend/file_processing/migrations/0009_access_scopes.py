@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0008_cachedembedding"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Generation",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("value", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SubjectAccessScope",
+            fields=[
+                (
+                    "subject",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("generation", models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="KnowledgeSourceAccess",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=255)),
+                (
+                    "knowledge_source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="file_processing.knowledgesource",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("subject", "knowledge_source"),
+                        name="unique_subject_knowledge_source_access",
+                    )
+                ],
+            },
+        ),
+    ]
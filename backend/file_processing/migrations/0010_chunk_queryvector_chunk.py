@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0009_access_scopes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Chunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest_hash", models.CharField(max_length=255)),
+                ("file", models.FileField(max_length=255, upload_to="")),
+                ("title", models.TextField(blank=True)),
+                ("text", models.TextField(blank=True)),
+                (
+                    "knowledge_source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="file_processing.knowledgesource",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("knowledge_source", "digest_hash"),
+                        name="unique_knowledge_source_chunk_digest",
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="queryvector",
+            name="chunk",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="file_processing.chunk",
+            ),
+        ),
+    ]
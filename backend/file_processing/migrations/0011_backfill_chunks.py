@@ -0,0 +1,97 @@
+import json
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+logger = logging.getLogger(__name__)
+
+# Before chunks were recorded, the vectors pointed at the query file they were
+# embedded from, which does not name its chunk: those vectors are kept, with
+# their query, under one unresolved chunk per knowledge source. Its empty
+# `file` keeps it out of the retrieval, and a new upload of the source drops it.
+UNRESOLVED_CHUNK_DIGEST = "unresolved-legacy-queries"
+
+
+def is_query_file(name: str) -> bool:
+    return name.endswith(".xml") and Path(name).parent.name == "queries"
+
+
+def read_chunk(chunk_name: str) -> dict:
+    try:
+        with open(settings.PRIVATE_MOUNT / chunk_name) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning(f"Could not read {chunk_name=}, its text is left empty")
+        return {}
+
+
+def read_query(query_name: str) -> str:
+    try:
+        query = ET.parse(settings.PRIVATE_MOUNT / query_name).getroot().find("query")
+    except (OSError, ET.ParseError):
+        logger.warning(f"Could not read {query_name=}, its query is left empty")
+        return ""
+    return (query.text or "") if query is not None else ""
+
+
+def forwards_func(apps, schema_editor):
+    """Creates a Chunk for every chunk file referenced by the query vectors"""
+    QueryVector = apps.get_model("file_processing", "QueryVector")
+    Chunk = apps.get_model("file_processing", "Chunk")
+
+    referenced = (
+        QueryVector.objects.filter(chunk__isnull=True)
+        .values_list("knowledge_source_id", "file")
+        .distinct()
+    )
+    for knowledge_source_id, name in referenced.iterator():
+        vectors = QueryVector.objects.filter(
+            knowledge_source_id=knowledge_source_id, file=name
+        )
+        if is_query_file(name):
+            chunk, _ = Chunk.objects.get_or_create(
+                knowledge_source_id=knowledge_source_id,
+                digest_hash=UNRESOLVED_CHUNK_DIGEST,
+                defaults={"file": ""},
+            )
+            vectors.update(chunk=chunk, query=read_query(name))
+            continue
+        data = read_chunk(name)
+        chunk, _ = Chunk.objects.get_or_create(
+            knowledge_source_id=knowledge_source_id,
+            digest_hash=data.get("digest_hash") or Path(name).stem,
+            defaults={
+                "file": name,
+                "title": data.get("title") or "",
+                "text": data.get("text") or "",
+            },
+        )
+        vectors.update(chunk=chunk)
+
+
+def reverse_func(apps, schema_editor):
+    QueryVector = apps.get_model("file_processing", "QueryVector")
+    Chunk = apps.get_model("file_processing", "Chunk")
+
+    for chunk in Chunk.objects.iterator():
+        QueryVector.objects.filter(chunk=chunk).update(file=chunk.file.name)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0010_chunk_queryvector_chunk"),
+    ]
+
+    operations = [
+        # The generated query the vector embeds, also searched lexically
+        migrations.AddField(
+            model_name="queryvector",
+            name="query",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
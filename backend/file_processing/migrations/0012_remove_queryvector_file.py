@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0011_backfill_chunks"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="queryvector",
+            name="file",
+        ),
+        migrations.AlterField(
+            model_name="queryvector",
+            name="chunk",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="file_processing.chunk",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+from django.db import migrations
+
+
+# (table, primary key column) of every VectorField
+VECTOR_TABLES = [
+    ("file_processing_queryvector", "id"),
+    ("file_processing_cachedembedding", "key"),
+]
+
+
+def convert_vectors(schema_editor, from_type: str, convert):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        # pgvector columns are not affected
+        return
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        for table, pk in VECTOR_TABLES:
+            cursor.execute(
+                f"SELECT {quote(pk)}, vector FROM {quote(table)} "
+                f"WHERE typeof(vector) = %s",
+                [from_type],
+            )
+            rows = cursor.fetchall()
+            cursor.executemany(
+                f"UPDATE {quote(table)} SET vector = %s WHERE {quote(pk)} = %s",
+                [(convert(vector), key) for key, vector in rows],
+            )
+
+
+def forwards_func(apps, schema_editor):
+    """Re-encodes the JSON text vectors as packed float32"""
+    convert_vectors(
+        schema_editor,
+        "text",
+        lambda vector: np.asarray(json.loads(vector), dtype="<f4").tobytes(),
+    )
+
+
+def reverse_func(apps, schema_editor):
+    convert_vectors(
+        schema_editor,
+        "blob",
+        lambda vector: json.dumps(np.frombuffer(vector, dtype="<f4").tolist()),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0012_remove_queryvector_file"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
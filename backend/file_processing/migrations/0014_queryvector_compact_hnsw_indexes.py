@@ -0,0 +1,57 @@
+from django.db import migrations
+
+
+# The HNSW index over the full `halfvec(3072)` cast of the column is replaced by
+# indexes over compact copies of the vectors, which only shortlist candidates
+# for an exact rerank (see `utils.rank_chunks_by_relevance`): the first 1024
+# dimensions of the Matryoshka embedding, and its binary quantization.
+# Requires pgvector >= 0.7.
+HALFVEC_INDEX_NAME = "file_processing_queryvector_vector_hnsw"
+COMPACT_INDEXES = {
+    "file_processing_queryvector_subvector_hnsw": (
+        "((subvector(vector, 1, 1024)::halfvec(1024)) halfvec_cosine_ops)"
+    ),
+    "file_processing_queryvector_binary_hnsw": (
+        "((binary_quantize(vector)::bit(3072)) bit_hamming_ops)"
+    ),
+}
+
+
+def forwards_func(apps, schema_editor):
+    """Only build the ANN indexes on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, expression in COMPACT_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON file_processing_queryvector USING hnsw {expression} "
+            "WITH (m = 16, ef_construction = 64);"
+        )
+    schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {HALFVEC_INDEX_NAME};")
+
+
+def reverse_func(apps, schema_editor):
+    """Only rebuild the ANN indexes on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {HALFVEC_INDEX_NAME} "
+        "ON file_processing_queryvector "
+        "USING hnsw ((vector::halfvec(3072)) halfvec_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64);"
+    )
+    for name in COMPACT_INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("file_processing", "0013_vector_binary_encoding"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
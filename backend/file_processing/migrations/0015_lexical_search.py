@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+# Full-text indexes of the lexical retrieval (see `lexical_search`). The
+# documents are built with the "simple" configuration: no stemming nor stop
+# words, so identifiers and error codes match verbatim in any language.
+LEXICAL_INDEXES = {
+    "file_processing_chunk_document_gin": (
+        "file_processing_chunk",
+        "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(text, ''))",
+    ),
+    "file_processing_queryvector_query_gin": (
+        "file_processing_queryvector",
+        "to_tsvector('simple', query)",
+    ),
+}
+
+
+def forwards_func(apps, schema_editor):
+    """Only build the full-text indexes on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, (table, document) in LEXICAL_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON {table} USING gin (({document}));"
+        )
+
+
+def reverse_func(apps, schema_editor):
+    """Only drop the full-text indexes on PostgreSQL"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in LEXICAL_INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("file_processing", "0014_queryvector_compact_hnsw_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
@@ -0,0 +1,83 @@
+import file_processing.models
+from django.db import migrations
+
+
+# The column becomes untyped to hold the vectors of embedding models of any
+# dimensions (see `embedders`), so the compact ANN indexes of migration 0014
+# become partial, per embedding model. The indexes of models added later are
+# built by the `reembed_queries` command.
+GLOBAL_INDEXES = {
+    "file_processing_queryvector_subvector_hnsw": (
+        "((subvector(vector, 1, 1024)::halfvec(1024)) halfvec_cosine_ops)"
+    ),
+    "file_processing_queryvector_binary_hnsw": (
+        "((binary_quantize(vector)::bit(3072)) bit_hamming_ops)"
+    ),
+}
+MODEL_INDEXES = {
+    "queryvector_text_embedding_3_large_subvector_hnsw": (
+        "((subvector(vector, 1, 1024)::halfvec(1024)) halfvec_cosine_ops)"
+    ),
+    "queryvector_text_embedding_3_large_binary_hnsw": (
+        "((binary_quantize(vector)::bit(3072)) bit_hamming_ops)"
+    ),
+}
+MODEL_PREDICATE = "embedding_model = 'text-embedding-3-large'"
+
+
+def create_indexes(schema_editor, indexes: dict[str, str], predicate: str = ""):
+    for name, expression in indexes.items():
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON file_processing_queryvector USING hnsw {expression} "
+            "WITH (m = 16, ef_construction = 64)"
+            + (f" WHERE {predicate};" if predicate else ";")
+        )
+
+
+def drop_indexes(schema_editor, indexes: dict[str, str]):
+    for name in indexes:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+def drop_global_indexes(apps, schema_editor):
+    """Only on PostgreSQL"""
+    if schema_editor.connection.vendor == "postgresql":
+        drop_indexes(schema_editor, GLOBAL_INDEXES)
+
+
+def create_global_indexes(apps, schema_editor):
+    """Only on PostgreSQL"""
+    if schema_editor.connection.vendor == "postgresql":
+        create_indexes(schema_editor, GLOBAL_INDEXES)
+
+
+def create_model_indexes(apps, schema_editor):
+    """Only on PostgreSQL"""
+    if schema_editor.connection.vendor == "postgresql":
+        create_indexes(schema_editor, MODEL_INDEXES, MODEL_PREDICATE)
+
+
+def drop_model_indexes(apps, schema_editor):
+    """Only on PostgreSQL"""
+    if schema_editor.connection.vendor == "postgresql":
+        drop_indexes(schema_editor, MODEL_INDEXES)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("file_processing", "0015_lexical_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_global_indexes, create_global_indexes),
+        migrations.AlterField(
+            model_name="queryvector",
+            name="vector",
+            field=file_processing.models.VectorField(null=True),
+        ),
+        migrations.RunPython(create_model_indexes, drop_model_indexes),
+    ]
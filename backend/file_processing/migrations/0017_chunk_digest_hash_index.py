@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("file_processing", "0016_queryvector_embedding_models"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chunk",
+            index=models.Index(fields=["digest_hash"], name="chunk_digest_hash_idx"),
+        ),
+    ]
@@ -4,48 +4,81 @@ from content_access_control.policy_mixins import (
     ResourceAccessPermissionMixin,
     ObjectIdentifierMixin,
 )
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 
 import json
+import numpy as np
 
 
 class VectorField(models.Field):
-    """A field that adapts to the database backend"""
-
-    def __init__(self, *args, **kwargs):
+    """
+    A field that adapts to the database backend.
+
+    PostgreSQL stores it as a pgvector `vector`. Elsewhere it is a BLOB of
+    packed little-endian floats (float32, or float16 with `precision="half"`),
+    decoded into a read-only numpy array over the stored bytes.
+    """
+
+    PRECISIONS = {"single": "<f4", "half": "<f2"}
+
+    def __init__(
+        self, *args, dimensions: int | None = None, precision: str = "single", **kwargs
+    ):
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"precision must be one of {list(self.PRECISIONS)}")
+        self.dimensions = dimensions
+        self.precision = precision
         super().__init__(*args, **kwargs)
 
+    @property
+    def binary_dtype(self) -> str:
+        return self.PRECISIONS[self.precision]
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dimensions is not None:
+            kwargs["dimensions"] = self.dimensions
+        if self.precision != "single":
+            kwargs["precision"] = self.precision
+        return name, path, args, kwargs
+
     def get_internal_type(self):
         if "postgresql" in settings.DATABASES["default"]["ENGINE"]:
             return "ArrayField"
-        return "TextField"
+        return "BinaryField"
 
     def db_type(self, connection):
         if connection.vendor == "postgresql":
-            return "vector"  # Will be handled by pgvector
-        return "TEXT"
+            # Will be handled by pgvector. ANN indexes need a typed column.
+            if self.dimensions is not None:
+                return f"vector({self.dimensions})"
+            return "vector"
+        return "BLOB"
 
     def from_db_value(self, value, expression, connection):
         if value is None:
             return value
         if connection.vendor == "postgresql":
-            return value
-        # For SQLite, parse JSON
-        return json.loads(value) if value else None
+            # Without a registered pgvector adapter the value arrives as text
+            return json.loads(value) if isinstance(value, str) else value
+        return self.to_python(value)
 
     def to_python(self, value):
-        if isinstance(value, list) or value is None:
+        if value is None or isinstance(value, (list, np.ndarray)):
             return value
-        return json.loads(value)
+        if isinstance(value, (bytes, memoryview)):
+            return np.frombuffer(value, dtype=self.binary_dtype)
+        # Rows written before the binary encoding (see migration 0013)
+        return json.loads(value) if value else None
 
     def get_prep_value(self, value):
         if value is None:
             return value
         if "postgresql" in settings.DATABASES["default"]["ENGINE"]:
-            return value
-        return json.dumps(value)
+            return value.tolist() if isinstance(value, np.ndarray) else value
+        return np.asarray(value, dtype=self.binary_dtype).tobytes()
 
 
 def upload_to(instance, filename):
@@ -62,13 +95,109 @@ class KnowledgeSource(
     file = models.FileField(upload_to=upload_to)
 
 
-class QueryVector(ObjectIdentifierMixin, models.Model):
+class Chunk(models.Model):
+    """
+    Section of a knowledge source, identified by the digest of its content.
+    `file` is the chunk JSON in the processing results on the storage mount.
+    """
+
     knowledge_source = models.ForeignKey(KnowledgeSource, on_delete=models.CASCADE)
+    digest_hash = models.CharField(max_length=255)
     file = models.FileField(max_length=255)
+    title = models.TextField(blank=True)
+    text = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["knowledge_source", "digest_hash"],
+                name="unique_knowledge_source_chunk_digest",
+            )
+        ]
+        indexes = [
+            # Chunks already indexed under another knowledge source (see `deduplication`)
+            models.Index(fields=["digest_hash"], name="chunk_digest_hash_idx"),
+        ]
+
+
+class QueryVector(ObjectIdentifierMixin, models.Model):
+    knowledge_source = models.ForeignKey(KnowledgeSource, on_delete=models.CASCADE)
+    chunk = models.ForeignKey(Chunk, on_delete=models.CASCADE)
+    # Generated query the vector embeds, also searched lexically
+    query = models.TextField(blank=True, default="")
+    # Untyped: the dimensions depend on the embedding model (see `embedders`)
     vector = VectorField(null=True, blank=False)
     embedding_model = models.CharField(max_length=255)
 
 
+class Generation(models.Model):
+    """
+    Named counter shared by all instances, bumped whenever the data a cache
+    was derived from changes (see `file_processing.generations`).
+    """
+
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+
+class KnowledgeSourceAccess(models.Model):
+    """Materialized "subject can access knowledge source" pairs (see `access_scopes`)"""
+
+    subject = models.CharField(max_length=255)
+    knowledge_source = models.ForeignKey(KnowledgeSource, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["subject", "knowledge_source"],
+                name="unique_subject_knowledge_source_access",
+            )
+        ]
+
+
+class SubjectAccessScope(models.Model):
+    """Marks the access policy generation the subject's access was materialized at"""
+
+    subject = models.CharField(max_length=255, primary_key=True)
+    generation = models.PositiveBigIntegerField()
+
+
+class CachedEmbedding(models.Model):
+    """Shared tier of the query embedding cache (see `embedding_cache`)"""
+
+    key = models.CharField(max_length=64, primary_key=True)
+    embedding_model = models.CharField(max_length=255)
+    vector = VectorField()
+    last_used_at = models.DateTimeField(db_index=True)
+
+
+@receiver(post_save, sender=KnowledgeSource)
+def invalidate_access_scopes_on_knowledge_source_created(
+    sender, instance=None, created=False, **kwargs
+):
+    if created:
+        from file_processing.access_scopes import invalidate_access_scopes
+
+        invalidate_access_scopes()
+
+
+@receiver(post_delete, sender=KnowledgeSource)
+def invalidate_access_scopes_on_knowledge_source_deleted(sender, **kwargs):
+    from file_processing.access_scopes import invalidate_access_scopes
+
+    invalidate_access_scopes()
+
+
+# Chunks and query vectors are written in bulk: their writers invalidate the
+# search index once per operation, and receivers on them would also turn every
+# cascading delete into one query per row.
+@receiver(post_delete, sender=KnowledgeSource)
+def invalidate_search_index_on_knowledge_source_deleted(sender, **kwargs):
+    from file_processing.result_cache import invalidate_search_index
+
+    invalidate_search_index()
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
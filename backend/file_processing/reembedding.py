@@ -0,0 +1,114 @@
+"""
+Re-embedding of the stored query vectors into another embedding model.
+
+The generated queries are kept with their vectors, so moving to a new model
+only re-embeds their text, without generating them again. Every batch adds
+the vectors of the target model next to the source ones; the queries already
+having a target vector are skipped, so the job can be interrupted and resumed
+at any point.
+
+Cutover:
+    1. Re-embed into the target model (and build its ANN indexes).
+    2. Set `EMBEDDING_MODEL` to the target and `EMBEDDING_DUAL_READ_MODELS`
+       to the source model: new vectors are written with the target model,
+       both are searched.
+    3. Re-embed again, for the vectors written with the source model meanwhile.
+    4. Clear `EMBEDDING_DUAL_READ_MODELS` and delete the source vectors.
+
+Vectors without their query text (legacy ones whose query file could not be
+read, see migration 0011) cannot be re-embedded: the source vectors are not
+deleted while any is left.
+"""
+
+import logging
+import re
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, QuerySet
+
+from file_processing.embedders import Embedder, embed_in_batches
+from file_processing.models import QueryVector
+from file_processing.result_cache import invalidate_search_index
+from file_processing.utils import FIRST_PASS_DIMENSIONS
+
+
+logger = logging.getLogger(__name__)
+
+
+def ann_indexes(embedder: Embedder) -> dict[str, str]:
+    """
+    Name -> indexed expression of the compact ANN indexes of the embedding
+    model (see `utils.FIRST_PASS_DISTANCES`), partial on its vectors.
+    """
+    slug = re.sub(r"\W", "_", embedder.model)
+    prefix = min(FIRST_PASS_DIMENSIONS, embedder.dimensions)
+    return {
+        f"queryvector_{slug}_subvector_hnsw": (
+            f"((subvector(vector, 1, {prefix})::halfvec({prefix})) halfvec_cosine_ops)"
+        ),
+        f"queryvector_{slug}_binary_hnsw": (
+            f"((binary_quantize(vector)::bit({embedder.dimensions})) bit_hamming_ops)"
+        ),
+    }
+
+
+def create_ann_indexes(embedder: Embedder):
+    """Builds the ANN indexes of the model, without blocking the writes"""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for name, expression in ann_indexes(embedder).items():
+            logger.info(f"Building {name=}")
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                f"ON file_processing_queryvector USING hnsw {expression} "
+                "WITH (m = 16, ef_construction = 64) "
+                f"WHERE embedding_model = '{embedder.model}';"
+            )
+
+
+def pending_queries(source: str, target: str) -> QuerySet[QueryVector]:
+    """Vectors of the source model whose query has no vector of the target model"""
+    reembedded = QueryVector.objects.filter(
+        chunk=OuterRef("chunk"), query=OuterRef("query"), embedding_model=target
+    )
+    return (
+        QueryVector.objects.filter(embedding_model=source)
+        .exclude(query="")
+        .exclude(Exists(reembedded))
+        .order_by("pk")
+    )
+
+
+def reembed_batch(source: str, target: Embedder, batch_size: int) -> int:
+    """Re-embeds the next batch of pending queries, returns its size"""
+    batch = list(
+        pending_queries(source, target.model).values(
+            "knowledge_source_id", "chunk_id", "query"
+        )[:batch_size]
+    )
+    if not batch:
+        return 0
+    embeddings = embed_in_batches(target, [row["query"] for row in batch])
+    QueryVector.objects.bulk_create(
+        QueryVector(**row, vector=embedding, embedding_model=target.model)
+        for row, embedding in zip(batch, embeddings)
+    )
+    invalidate_search_index()
+    return len(batch)
+
+
+def unembeddable_queries(source: str) -> QuerySet[QueryVector]:
+    """Vectors of the source model without the query text to re-embed"""
+    return QueryVector.objects.filter(embedding_model=source, query="")
+
+
+def delete_vectors(embedding_model: str, batch_size: int) -> int:
+    """Deletes the vectors of the model, in batches, returns how many"""
+    vectors = QueryVector.objects.filter(embedding_model=embedding_model)
+    deleted = 0
+    while batch := list(vectors.values_list("pk", flat=True)[:batch_size]):
+        deleted += QueryVector.objects.filter(pk__in=batch).delete()[0]
+    if deleted:
+        invalidate_search_index()
+    return deleted
@@ -0,0 +1,35 @@
+"""
+Incremental re-indexing of re-uploaded documents.
+
+A new version of a file is extracted again, but only its chunks without
+query vectors of the active embedding model are indexed (their digest is
+that of their content, so an unchanged section keeps its chunk and its
+vectors). The chunks of the previous version whose digest is gone are
+deleted, with their vectors.
+"""
+
+import logging
+
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+from file_processing.result_cache import invalidate_search_index
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_indexed(chunk: Chunk, embedding_model: str) -> bool:
+    return QueryVector.objects.filter(
+        chunk=chunk, embedding_model=embedding_model
+    ).exists()
+
+
+def remove_stale_chunks(knowledge_source: KnowledgeSource, digests: list[str]) -> int:
+    """Deletes the chunks of the source not in `digests`, returns how many"""
+    stale = Chunk.objects.filter(knowledge_source=knowledge_source).exclude(
+        digest_hash__in=digests
+    )
+    deleted = stale.delete()[1].get(Chunk._meta.label, 0)
+    if deleted:
+        invalidate_search_index()
+        logger.info(f"Removed {deleted} stale chunks of {knowledge_source.pk=}")
+    return deleted
@@ -0,0 +1,191 @@
+"""
+Post-retrieval reranking of the candidate chunks of every query.
+
+The retrieval over-fetches `RERANK_CANDIDATES_PER_RESULT` candidates per
+requested chunk, which a reranker scores against the query text, and
+optionally reorders them with maximal marginal relevance (MMR) so that
+near-duplicate chunks do not crowd out the rest of the results.
+
+A reranker takes the queries and the contents of their candidates and returns
+the relevance scores, higher is better. It scores the whole batch at once.
+"""
+
+import math
+import re
+from collections import Counter
+from functools import cache
+from importlib.util import find_spec
+from typing import Callable
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+RERANK_FUNCTION_T = Callable[[list[str], list[list[str]]], list[list[float]]]
+
+WORD = re.compile(r"\w+")
+
+
+def tokens(text: str) -> list[str]:
+    return WORD.findall(text.lower())
+
+
+def bm25_scores(queries: list[str], candidates: list[list[str]]) -> list[list[float]]:
+    """
+    Okapi BM25 of the query terms in every candidate, with the candidates of
+    the query as the corpus. Cheap, local, and rewards the exact terms dense
+    retrieval tends to blur.
+    """
+    k1, b = 1.2, 0.75
+    scores = []
+    for query, documents in zip(queries, candidates):
+        term_counts = [Counter(tokens(document)) for document in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = sum(lengths) / len(lengths) if lengths else 0
+        query_terms = set(tokens(query))
+        document_frequency = {
+            term: sum(term in counts for counts in term_counts) for term in query_terms
+        }
+        query_scores = []
+        for counts, length in zip(term_counts, lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = counts[term]
+                if not frequency:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+                norm = k1 * (1 - b + b * length / (average_length or 1))
+                score += idf * frequency * (k1 + 1) / (frequency + norm)
+            query_scores.append(score)
+        scores.append(query_scores)
+    return scores
+
+
+@cache
+def cross_encoder():
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(settings.RERANK_CROSS_ENCODER_MODEL, device="cpu")
+
+
+def cross_encoder_scores(
+    queries: list[str], candidates: list[list[str]]
+) -> list[list[float]]:
+    """Small CPU cross-encoder (optional `sentence-transformers` dependency)"""
+    pairs = [
+        (query, document)
+        for query, documents in zip(queries, candidates)
+        for document in documents
+    ]
+    flat = list(cross_encoder().predict(pairs, batch_size=32)) if pairs else []
+    scores = []
+    for documents in candidates:
+        scores.append([float(score) for score in flat[: len(documents)]])
+        flat = flat[len(documents) :]
+    return scores
+
+
+RERANKERS: dict[str, RERANK_FUNCTION_T] = {
+    "bm25": bm25_scores,
+    "cross_encoder": cross_encoder_scores,
+}
+# Rerankers needing a module which is not a dependency of the project
+OPTIONAL_RERANKER_MODULES = {"cross_encoder": "sentence_transformers"}
+
+
+@cache
+def available_rerankers() -> list[str]:
+    """The rerankers which can run: those whose optional module is installed"""
+    return [
+        name
+        for name in RERANKERS
+        if name not in OPTIONAL_RERANKER_MODULES
+        or find_spec(OPTIONAL_RERANKER_MODULES[name]) is not None
+    ]
+
+
+def jaccard_similarity(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def maximal_marginal_relevance(
+    hits: list[dict], top_k: int, diversity: float
+) -> list[dict]:
+    """
+    Greedily picks the hit maximizing
+    (1 - diversity) * relevance - diversity * max similarity to the picked ones,
+    with relevance min-max normalized and the word overlap as the similarity.
+    """
+    if not hits:
+        return hits
+    scores = [hit["score"] for hit in hits]
+    low, high = min(scores), max(scores)
+    relevance = [
+        (score - low) / (high - low) if high > low else 1.0 for score in scores
+    ]
+    words = [set(tokens(hit["content"])) for hit in hits]
+
+    remaining = list(range(len(hits)))
+    redundancy = [0.0] * len(hits)
+    picked = []
+    while remaining and len(picked) < top_k:
+        best = max(
+            remaining,
+            key=lambda i: (1 - diversity) * relevance[i] - diversity * redundancy[i],
+        )
+        picked.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            similarity = jaccard_similarity(words[i], words[best])
+            redundancy[i] = max(redundancy[i], similarity)
+    return [hits[i] for i in picked]
+
+
+def resolve_reranking(
+    reranker: str | None = None, diversity: float | None = None
+) -> tuple[str | None, float]:
+    """The per request reranking options, falling back to the settings"""
+    reranker = settings.RERANKER if reranker is None else reranker
+    diversity = settings.RERANK_DIVERSITY if diversity is None else diversity
+    if reranker in ("", "none"):
+        return None, diversity
+    if reranker not in available_rerankers():
+        raise ImproperlyConfigured(
+            f"Reranker {reranker!r} is unknown or misses its optional module, "
+            f"one of {available_rerankers()}"
+        )
+    return reranker, diversity
+
+
+def candidate_count(top_k: int, reranker: str | None, diversity: float) -> int:
+    if reranker or diversity:
+        return top_k * settings.RERANK_CANDIDATES_PER_RESULT
+    return top_k
+
+
+def rerank(
+    queries: list[str],
+    ranked: list[list[dict]],
+    top_k: int,
+    reranker: str | None = None,
+    diversity: float = 0.0,
+) -> list[list[dict]]:
+    """
+    Reorders the hits of every query (with their "content"), replacing their
+    "score" with the one of the reranker, if any.
+    """
+    if reranker:
+        contents = [[hit["content"] for hit in hits] for hits in ranked]
+        scores = RERANKERS[reranker](queries, contents)
+        ranked = [
+            sorted(
+                ({**hit, "score": score} for hit, score in zip(hits, query_scores)),
+                key=lambda hit: hit["score"],
+                reverse=True,
+            )
+            for hits, query_scores in zip(ranked, scores)
+        ]
+    if diversity:
+        ranked = [maximal_marginal_relevance(hits, top_k, diversity) for hits in ranked]
+    return ranked
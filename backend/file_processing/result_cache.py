@@ -0,0 +1,66 @@
+"""
+In-process cache of the retrieved chunks, in front of the whole retrieval:
+a hit skips the embedding, the search and the reads of the chunk bodies.
+
+Results are keyed by the normalized query, the retrieval options, the digest
+of the subject's accessible knowledge sources (so subjects with the same
+access share them) and the `search_index` generation. The generation is bumped
+once by every operation writing chunks or query vectors, and on deletion of a
+knowledge source, so a stale result is never served: its key can no longer be
+built.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+
+from file_processing.access_scopes import accessible_knowledge_source_ids
+from file_processing.caching import LRUCache
+from file_processing.embedding_cache import normalize_text
+from file_processing.generations import bump_generation, current_generation
+
+
+SEARCH_INDEX_GENERATION = "search_index"
+
+# key -> retrieved chunks, weighted by their length in characters
+results = LRUCache(
+    settings.RESULT_CACHE_MAX_CHARACTERS,
+    weigh=lambda chunks: sum(len(chunk.content) for chunk in chunks) + 1,
+)
+# accessible knowledge source ids -> their digest
+scope_digests = LRUCache(settings.ACCESS_SCOPE_CACHE_MAX_SUBJECTS)
+
+
+# Called by every writer of query vectors: bulk inserts send no signals
+def invalidate_search_index():
+    bump_generation(SEARCH_INDEX_GENERATION)
+
+
+def scope_digest(ks_ids: frozenset[int]) -> str:
+    digest = scope_digests.get(ks_ids)
+    if digest is None:
+        ids = ",".join(map(str, sorted(ks_ids)))
+        digest = hashlib.sha256(ids.encode()).hexdigest()
+        scope_digests.set(ks_ids, digest)
+    return digest
+
+
+def result_keys(subject: str, queries: list[str], **options) -> list[str]:
+    """Cache keys of the results of the queries, for the current index and access"""
+    scope = scope_digest(accessible_knowledge_source_ids(subject))
+    generation = current_generation(SEARCH_INDEX_GENERATION)
+    prefix = json.dumps([scope, generation, options], sort_keys=True)
+    return [
+        hashlib.sha256(f"{prefix}\n{normalize_text(query)}".encode()).hexdigest()
+        for query in queries
+    ]
+
+
+def cached_results(keys: list[str]) -> list[list | None]:
+    return [results.get(key) for key in keys]
+
+
+def remember_results(keys: list[str], chunks: list[list]):
+    for key, retrieved in zip(keys, chunks):
+        results.set(key, retrieved)
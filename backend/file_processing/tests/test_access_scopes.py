@@ -0,0 +1,120 @@
+import casbin
+import pytest
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from content_access_control.models import CasbinRule
+
+from file_processing import access_scopes
+from file_processing.models import (
+    Chunk,
+    KnowledgeSource,
+    KnowledgeSourceAccess,
+    QueryVector,
+)
+from file_processing.utils import filter_queries_by_subject_access
+
+
+@pytest.fixture
+def knowledge_sources(db):
+    access_scopes.memory_scopes.clear()
+    access_scopes.materialized_generations.clear()
+    owner = User.objects.create(username="owner")
+    return [
+        KnowledgeSource.objects.create(owner=owner, file=f"owner/{name}")
+        for name in ("a.pdf", "b.pdf")
+    ]
+
+
+@pytest.fixture
+def mock_policy_ids(knowledge_sources):
+    granted = str(knowledge_sources[0].pk)
+    with patch.object(
+        access_scopes,
+        "subject_accessible_knowledge_sources",
+        return_value=[granted, "999999"],
+    ) as mock_policies:
+        yield mock_policies
+
+
+def test_access_scope_is_materialized_once(knowledge_sources, mock_policy_ids):
+    expected = {knowledge_sources[0].pk}
+
+    assert access_scopes.accessible_knowledge_source_ids("user") == expected
+    access_scopes.memory_scopes.clear()
+    assert access_scopes.accessible_knowledge_source_ids("user") == expected
+    assert mock_policy_ids.call_count == 1
+
+
+def test_access_scope_invalidated_on_policy_change(knowledge_sources, mock_policy_ids):
+    access_scopes.accessible_knowledge_source_ids("user")
+    with patch.object(access_scopes.core.enforcer, "load_policy") as mock_load:
+        access_scopes.core.enforcer.add_policy("user", "x", "access")
+        access_scopes.accessible_knowledge_source_ids("user")
+
+    mock_load.assert_called_once()
+    assert mock_policy_ids.call_count == 2
+
+
+def test_first_scope_reloads_the_policies_loaded_at_startup(
+    knowledge_sources, monkeypatch
+):
+    monkeypatch.setattr(access_scopes, "_enforcer_generation", None)
+    access_scopes.core.enforcer.load_policy()
+    # Granted through another instance, after this one loaded the policies
+    granted = knowledge_sources[1]
+    CasbinRule.objects.create(
+        ptype="p",
+        v0="user",
+        v1=f"{access_scopes.KNOWLEDGE_SOURCE_OBJECT_PREFIX}:{granted.pk}",
+        v2="access",
+    )
+    access_scopes.invalidate_access_scopes()
+
+    assert access_scopes.accessible_knowledge_source_ids("user") == {granted.pk}
+    assert list(
+        KnowledgeSourceAccess.objects.filter(subject="user").values_list(
+            "knowledge_source_id", flat=True
+        )
+    ) == [granted.pk]
+
+
+def test_policy_writes_invalidate_scopes_once(db, settings):
+    enforcer = casbin.Enforcer(settings.CASBIN_MODEL, access_scopes.PolicyAdapter())
+    for index in range(3):
+        enforcer.get_model().add_policy("p", "p", ["user", f"object:{index}", "access"])
+
+    with patch.object(access_scopes, "invalidate_access_scopes") as mock_invalidate:
+        enforcer.save_policy()
+        assert CasbinRule.objects.count() == 3
+        assert mock_invalidate.call_count == 1
+
+        enforcer.remove_filtered_policy(0, "user")
+        assert not CasbinRule.objects.exists()
+        assert mock_invalidate.call_count == 2
+
+        enforcer.remove_filtered_policy(0, "user")
+        assert mock_invalidate.call_count == 2
+
+
+def test_access_scope_invalidated_on_knowledge_source_delete(
+    knowledge_sources, mock_policy_ids
+):
+    access_scopes.accessible_knowledge_source_ids("user")
+    knowledge_sources[0].delete()
+
+    assert access_scopes.accessible_knowledge_source_ids("user") == set()
+
+
+@pytest.mark.parametrize("access_filter", ["join", "in_list"])
+def test_filter_queries_by_subject_access(
+    knowledge_sources, mock_policy_ids, access_filter
+):
+    for knowledge_source in knowledge_sources:
+        chunk = Chunk.objects.create(
+            knowledge_source=knowledge_source, digest_hash=knowledge_source.file.name
+        )
+        QueryVector.objects.create(knowledge_source=knowledge_source, chunk=chunk)
+
+    queries = filter_queries_by_subject_access("user", access_filter)
+
+    assert [query.chunk.digest_hash for query in queries] == ["owner/a.pdf"]
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.db import connection
+from psycopg import AsyncClientCursor
+
+from backend import asgi
+from file_processing import async_db
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="connects to PostgreSQL only"
+)
+def test_pool_connects_like_django(monkeypatch):
+    monkeypatch.setitem(connection.settings_dict["OPTIONS"], "sslmode", "require")
+
+    parameters = async_db.connection_parameters()
+
+    assert parameters["sslmode"] == "require"
+    assert parameters["dbname"] == connection.settings_dict["NAME"]
+    assert parameters["cursor_factory"] is AsyncClientCursor
+
+
+def test_run_blocking_leaves_the_shared_thread_free():
+    async def threads():
+        shared = await sync_to_async(threading.get_ident)()
+        own = await async_db.run_blocking(threading.get_ident)
+        return shared, own
+
+    shared, own = asyncio.run(threads())
+    assert own != shared
+
+
+def test_pool_follows_the_server_lifespan():
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    with (
+        patch.object(async_db, "open_pool") as mock_open,
+        patch.object(async_db, "close_pool") as mock_close,
+    ):
+        asyncio.run(asgi.application({"type": "lifespan"}, receive, send))
+
+    mock_open.assert_awaited_once()
+    mock_close.assert_awaited_once()
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
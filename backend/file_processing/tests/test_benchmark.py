@@ -0,0 +1,51 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from file_processing import access_scopes, benchmark
+
+
+@pytest.fixture
+def corpus(db):
+    access_scopes.memory_scopes.clear()
+    benchmark.generate_corpus(
+        knowledge_sources=4,
+        chunks=40,
+        queries_per_chunk=2,
+        subjects=2,
+        clusters=3,
+        dimensions=16,
+    )
+
+
+def test_benchmark_recall_against_exact_search(corpus):
+    queries = benchmark.benchmark_queries(10)
+    subjects = [benchmark.benchmark_subject(index) for index in range(2)]
+
+    report = benchmark.run_benchmark(queries, subjects, top_k=5, mode="vector")
+
+    assert report.queries == 10
+    assert report.recall == pytest.approx(1.0)
+    assert report.p50_ms <= report.p99_ms
+    assert access_scopes.accessible_knowledge_source_ids(subjects[0])
+
+
+def test_benchmark_command_reports_every_configuration(corpus):
+    out = StringIO()
+
+    call_command(
+        "benchmark_retrieval",
+        "--benchmark-subjects=2",
+        "--queries=4",
+        "--top-k=5",
+        "--first-pass=subvector",
+        stdout=out,
+    )
+
+    lines = out.getvalue().splitlines()
+    assert [line.split(":")[0] for line in lines] == [
+        "first_pass='subvector' access_filter='in_list' queries=4",
+        "first_pass='subvector' access_filter='join' queries=4",
+    ]
+    assert all(line.endswith("recall@5=1.000") for line in lines)
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+
+from file_processing.deduplication import reuse_indexed_twin
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+
+
+def test_chunk_reuses_the_queries_of_an_indexed_twin(db):
+    owner = User.objects.create(username="owner")
+    first = KnowledgeSource.objects.create(owner=owner, file="owner/a.pdf")
+    second = KnowledgeSource.objects.create(owner=owner, file="owner/b.pdf")
+    indexed = Chunk.objects.create(knowledge_source=first, digest_hash="same")
+    for query in ("first", "second"):
+        QueryVector.objects.create(
+            knowledge_source=first,
+            chunk=indexed,
+            query=query,
+            vector=[1, 0],
+            embedding_model="model",
+        )
+    duplicate = Chunk.objects.create(knowledge_source=second, digest_hash="same")
+    other = Chunk.objects.create(knowledge_source=second, digest_hash="other")
+
+    assert not reuse_indexed_twin(duplicate, "another-model")
+    assert reuse_indexed_twin(duplicate, "model")
+    assert not reuse_indexed_twin(other, "model")
+
+    copies = QueryVector.objects.filter(chunk=duplicate).order_by("query")
+    assert [(copy.query, copy.knowledge_source_id) for copy in copies] == [
+        ("first", second.pk),
+        ("second", second.pk),
+    ]
+    assert list(copies[0].vector) == [1, 0]
+    assert QueryVector.objects.filter(chunk=indexed).count() == 2
@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from file_processing.caching import LRUCache
+from file_processing.embedding_cache import (
+    EmbeddingCache,
+    normalize_text,
+    prometheus_lines,
+)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_weight=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_bounded_by_weight():
+    cache = LRUCache(max_weight=10, weigh=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "x" * 6)
+
+    assert cache.get("a") is None
+    assert cache.weight == 6
+
+
+def test_normalize_text():
+    assert (
+        normalize_text("  cloud \n computing\tbenefits ") == "cloud computing benefits"
+    )
+
+
+@pytest.fixture
+def embedding_cache(settings):
+    settings.EMBEDDING_CACHE_MEMORY_ENTRIES = 8
+    embed = MagicMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+    cache = EmbeddingCache(embed, "test-model")
+    with (
+        patch.object(cache, "_shared_get", return_value={}) as shared_get,
+        patch.object(cache, "_shared_set") as shared_set,
+    ):
+        cache.shared_get = shared_get
+        cache.shared_set = shared_set
+        yield cache
+
+
+def test_embedding_cache_embeds_only_misses(embedding_cache):
+    assert embedding_cache.embed("abc") == [3.0]
+    assert embedding_cache.embed(" abc  ") == [3.0]
+
+    embedding_cache.embed_function.assert_called_once_with(["abc"])
+    embedding_cache.shared_set.assert_called_once()
+    assert embedding_cache.stats()["memory_hits"] == 1
+    assert embedding_cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_batches_misses(embedding_cache):
+    embedding_cache.embed("a")
+    result = embedding_cache.embed_many(["a", "bb", "ccc", "bb"])
+
+    assert result == [[1.0], [2.0], [3.0], [2.0]]
+    embedding_cache.embed_function.assert_called_with(["bb", "ccc"])
+
+
+def test_embedding_cache_uses_shared_tier(embedding_cache):
+    embedding_cache.shared_get.side_effect = lambda keys: {keys[0]: [0.5]}
+
+    assert embedding_cache.embed("abc") == [0.5]
+    embedding_cache.embed_function.assert_not_called()
+    assert embedding_cache.stats()["shared_hits"] == 1
+
+
+def test_embedding_cache_async_shares_memory_tier(embedding_cache):
+    embedding_cache.aembed_function = AsyncMock(
+        side_effect=lambda texts: [[float(len(t))] for t in texts]
+    )
+    embedding_cache.embed("a")
+
+    result = asyncio.run(embedding_cache.aembed_many(["a", "bb"]))
+
+    assert result == [[1.0], [2.0]]
+    embedding_cache.aembed_function.assert_awaited_once_with(["bb"])
+    assert embedding_cache.embed("bb") == [2.0]
+    assert embedding_cache.stats()["misses"] == 2
+
+
+def test_embedding_cache_stats_are_exported(embedding_cache):
+    embedding_cache.embed_many(["a", "a"])
+
+    lines = prometheus_lines({"test-model": embedding_cache})
+
+    assert 'embedding_cache_lookups_total{model="test-model",result="misses"} 1' in (
+        lines
+    )
+    assert 'embedding_cache_memory_entries{model="test-model"} 1' in lines
@@ -4,6 +4,10 @@ from rest_framework import status
 import logging
 from pathlib import Path
 
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
 from file_processing.views import eventarc
 
 
@@ -55,31 +59,201 @@ def test_process_eventarc_message_other(mock_serializer):
     assert response.status_code == status.HTTP_204_NO_CONTENT
 
 
-@patch("file_processing.views.eventarc.insert_vector")
-@patch("file_processing.views.eventarc.embed_content")
+@patch("file_processing.views.eventarc.insert_vectors")
+@patch("file_processing.views.eventarc.embed_in_batches")
+@patch("file_processing.views.eventarc.active_embedder")
+@patch("file_processing.views.eventarc.Chunk.objects.get_or_create")
 @patch("file_processing.views.eventarc.KnowledgeSource.objects.get")
 @patch("builtins.open", new_callable=mock_open)
 @patch("file_processing.views.eventarc.settings")
 def test_process_query(
-    mock_settings, mock_open_file, mock_ks_get, mock_embed_content, mock_insert_vector
+    mock_settings,
+    mock_open_file,
+    mock_ks_get,
+    mock_chunk_get_or_create,
+    mock_active_embedder,
+    mock_embed_in_batches,
+    mock_insert_vectors,
 ):
     object_name = "process-results/some-id/queries/0.xml"
     mock_settings.PRIVATE_MOUNT = Path("/fake/mount")
 
     # Mock file contents
-    query_content = "<root><query>test query</query><answer>test answer</answer></root>"
+    query_content = (
+        "<root><query>test query</query>"
+        "<chunk>process-results/some-id/chunks/abc.json</chunk></root>"
+    )
     metadata_content = "Original Filename: django-uploads/user/file.txt\n"
     mock_open_file.side_effect = [
         mock_open(read_data=query_content).return_value,
         mock_open(read_data=metadata_content).return_value,
     ]
 
-    mock_embed_content.return_value = [[0.1, 0.2, 0.3]]
+    mock_embedder = mock_active_embedder.return_value
+    mock_embedder.model = "embedding-model"
+    mock_embed_in_batches.return_value = [[0.1, 0.2, 0.3]]
     mock_ks = MagicMock()
     mock_ks_get.return_value = mock_ks
+    mock_chunk = MagicMock()
+    mock_chunk_get_or_create.return_value = (mock_chunk, False)
 
     eventarc.process_query(object_name)
 
     mock_ks_get.assert_called_once_with(file="user/file.txt")
-    mock_embed_content.assert_called_once_with("test query")
-    mock_insert_vector.assert_called_once_with(object_name, mock_ks, [0.1, 0.2, 0.3])
+    mock_embed_in_batches.assert_called_once_with(mock_embedder, ["test query"])
+    mock_insert_vectors.assert_called_once_with(
+        mock_chunk, ["test query"], [[0.1, 0.2, 0.3]], "embedding-model"
+    )
+
+
+@patch("file_processing.views.eventarc.insert_vectors")
+@patch("file_processing.views.eventarc.embed_in_batches")
+@patch("file_processing.views.eventarc.active_embedder")
+@patch("file_processing.views.eventarc.Chunk.objects.get_or_create")
+@patch("file_processing.views.eventarc.KnowledgeSource.objects.get")
+@patch("builtins.open", new_callable=mock_open)
+@patch("file_processing.views.eventarc.settings")
+def test_process_query_links_vector_to_chunk(
+    mock_settings,
+    mock_open_file,
+    mock_ks_get,
+    mock_chunk_get_or_create,
+    mock_active_embedder,
+    mock_embed_in_batches,
+    mock_insert_vectors,
+):
+    object_name = "process-results/some-id/queries/0.xml"
+    chunk_name = "process-results/some-id/chunks/abc.json"
+    mock_settings.PRIVATE_MOUNT = Path("/fake/mount")
+
+    query_content = (
+        "<root><query>test query</query><query>other query</query>"
+        f"<chunk>{chunk_name}</chunk></root>"
+    )
+    metadata_content = "Original Filename: django-uploads/user/file.txt\n"
+    mock_open_file.side_effect = [
+        mock_open(read_data=query_content).return_value,
+        mock_open(read_data=metadata_content).return_value,
+    ]
+
+    mock_embedder = mock_active_embedder.return_value
+    mock_embedder.model = "embedding-model"
+    mock_embed_in_batches.return_value = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
+    mock_ks = MagicMock()
+    mock_ks_get.return_value = mock_ks
+    mock_chunk = MagicMock()
+    mock_chunk_get_or_create.return_value = (mock_chunk, False)
+
+    eventarc.process_query(object_name)
+
+    mock_chunk_get_or_create.assert_called_once_with(
+        knowledge_source=mock_ks, digest_hash="abc", defaults={"file": chunk_name}
+    )
+    mock_insert_vectors.assert_called_once_with(
+        mock_chunk,
+        ["test query", "other query"],
+        [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]],
+        "embedding-model",
+    )
+
+
+@patch("file_processing.views.eventarc.embed_in_batches")
+@patch("file_processing.views.eventarc.active_embedder")
+@patch("file_processing.views.eventarc.query_generator")
+def test_index_document_embeds_all_queries_at_once(
+    mock_query_generator, mock_active_embedder, mock_embed_in_batches, db, settings
+):
+    settings.INGESTION_QUERY_ARTIFACTS = False
+    settings.CHUNK_DEDUPLICATION = False
+    owner = User.objects.create(username="owner")
+    ks = KnowledgeSource.objects.create(owner=owner, file="owner/file.pdf")
+    mock_query_generator.generate_many.return_value = [
+        eventarc.Questions(questions=["a", "b"]),
+        eventarc.Questions(questions=["c"]),
+    ]
+    mock_active_embedder.return_value.model = "embedding-model"
+    mock_embed_in_batches.return_value = [[0.1], [0.2], [0.3]]
+
+    eventarc.index_document(
+        ks,
+        ["results/chunks/first.json", "results/chunks/second.json"],
+        [{"digest_hash": "first"}, {"digest_hash": "second"}],
+        Path("/fake/queries"),
+    )
+
+    mock_embed_in_batches.assert_called_once_with(
+        mock_active_embedder.return_value, ["a", "b", "c"]
+    )
+    vectors = QueryVector.objects.order_by("query")
+    assert [
+        (vector.chunk.digest_hash, vector.query, list(vector.vector))
+        for vector in vectors
+    ] == [("first", "a", [0.1]), ("first", "b", [0.2]), ("second", "c", [0.3])]
+
+
+@patch("file_processing.views.eventarc.embed_in_batches")
+@patch("file_processing.views.eventarc.active_embedder")
+@patch("file_processing.views.eventarc.query_generator")
+def test_index_document_writes_nothing_when_a_write_fails(
+    mock_query_generator, mock_active_embedder, mock_embed_in_batches, db, settings
+):
+    settings.INGESTION_QUERY_ARTIFACTS = False
+    settings.CHUNK_DEDUPLICATION = False
+    owner = User.objects.create(username="owner")
+    ks = KnowledgeSource.objects.create(owner=owner, file="owner/file.pdf")
+    mock_query_generator.generate_many.return_value = [
+        eventarc.Questions(questions=["a"])
+    ]
+    mock_active_embedder.return_value.model = "embedding-model"
+    mock_embed_in_batches.return_value = [[0.1]]
+
+    with (
+        patch.object(QueryVector.objects, "bulk_create", side_effect=DatabaseError),
+        pytest.raises(DatabaseError),
+    ):
+        eventarc.index_document(
+            ks, ["results/chunks/first.json"], [{"digest_hash": "first"}], Path()
+        )
+
+    assert not Chunk.objects.exists()
+
+
+@patch("file_processing.views.eventarc.insert_vectors")
+@patch("builtins.open", new_callable=mock_open)
+@patch("file_processing.views.eventarc.settings")
+def test_process_query_skips_direct_pipeline_results(
+    mock_settings, mock_open_file, mock_insert_vectors
+):
+    mock_settings.PRIVATE_MOUNT = Path("/fake/mount")
+    mock_open_file.side_effect = [
+        mock_open(
+            read_data="<root><query>test query</query>"
+            "<chunk>process-results/some-id/chunks/abc.json</chunk></root>"
+        ).return_value,
+        mock_open(
+            read_data="Original Filename: django-uploads/user/file.txt\n"
+            f"{eventarc.DIRECT_PIPELINE_MARK}\n"
+        ).return_value,
+    ]
+
+    eventarc.process_query("process-results/some-id/queries/0.xml")
+
+    mock_insert_vectors.assert_not_called()
+
+
+@patch("file_processing.views.eventarc.Chunk.objects.get_or_create")
+@patch("file_processing.views.eventarc.insert_vectors")
+@patch("builtins.open", new_callable=mock_open)
+@patch("file_processing.views.eventarc.settings")
+def test_process_query_skips_query_files_without_chunk(
+    mock_settings, mock_open_file, mock_insert_vectors, mock_chunk_get_or_create
+):
+    mock_settings.PRIVATE_MOUNT = Path("/fake/mount")
+    mock_open_file.side_effect = [
+        mock_open(read_data="<root><query>test query</query></root>").return_value,
+    ]
+
+    eventarc.process_query("process-results/some-id/queries/0.xml")
+
+    mock_chunk_get_or_create.assert_not_called()
+    mock_insert_vectors.assert_not_called()
@@ -0,0 +1,45 @@
+import pytest
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+
+@pytest.fixture
+def metrics_token(settings):
+    settings.METRICS_TOKEN = "scraper-token"
+    return settings.METRICS_TOKEN
+
+
+def test_metrics_are_served_to_the_scraper(metrics_token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {metrics_token}")
+
+    response = client.get(reverse("metrics"))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/plain; version=0.0.4"
+
+
+@pytest.mark.parametrize("auth_header", [None, "Bearer other-token", "scraper-token"])
+def test_metrics_require_the_scraper_token(metrics_token, auth_header):
+    client = APIClient()
+    if auth_header:
+        client.credentials(HTTP_AUTHORIZATION=auth_header)
+
+    response = client.get(reverse("metrics"))
+
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_metrics_are_closed_to_users_without_a_token(db, settings):
+    settings.METRICS_TOKEN = ""
+    client = APIClient()
+    client.force_login(User.objects.create(username="alice"))
+
+    for auth_header in [None, "Bearer "]:
+        if auth_header:
+            client.credentials(HTTP_AUTHORIZATION=auth_header)
+        response = client.get(reverse("metrics"))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,17 @@
+from importlib import import_module
+
+
+backfill_chunks = import_module("file_processing.migrations.0011_backfill_chunks")
+
+
+def test_backfill_reads_the_query_of_legacy_query_files(settings, tmp_path):
+    settings.PRIVATE_MOUNT = tmp_path
+    queries = tmp_path / "process-results" / "some-id" / "queries"
+    queries.mkdir(parents=True)
+    (queries / "0.xml").write_text("<root><query>rotate the keys</query></root>")
+    name = "process-results/some-id/queries/0.xml"
+
+    assert backfill_chunks.is_query_file(name)
+    assert not backfill_chunks.is_query_file("process-results/some-id/chunks/a.json")
+    assert backfill_chunks.read_query(name) == "rotate the keys"
+    assert backfill_chunks.read_query("process-results/some-id/queries/1.xml") == ""
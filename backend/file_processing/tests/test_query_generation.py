@@ -0,0 +1,110 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+import pytest
+
+from django.test.utils import override_settings
+
+from file_processing import hypo_query_generation
+from file_processing.hypo_query_generation import Questions
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@override_settings(
+    QUERY_GENERATION_CONCURRENCY=2,
+    QUERY_GENERATION_MAX_RETRIES=1,
+    QUERY_GENERATION_BACKOFF=0.01,
+)
+def test_generation_is_bounded_and_retries_rate_limits(monkeypatch):
+    running, peak, attempts = 0, 0, {}
+
+    async def structured_queries(agent, text):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.01)
+            attempts[text] = attempts.get(text, 0) + 1
+            if text == "limited" and attempts[text] == 1:
+                raise RuntimeError("generation failed") from RateLimitError()
+            if text == "broken":
+                raise ValueError("not a rate limit")
+            return Questions(questions=[text])
+        finally:
+            running -= 1
+
+    @asynccontextmanager
+    async def session():
+        yield None
+
+    monkeypatch.setattr(hypo_query_generation, "structured_queries", structured_queries)
+    monkeypatch.setattr(hypo_query_generation.session_pool, "session", session)
+    texts = ["a", "limited", "broken", "b", "c"]
+
+    results = asyncio.run(hypo_query_generation.agenerate_queries_many(texts))
+
+    assert [result and result.questions for result in results] == [
+        ["a"],
+        ["limited"],
+        None,
+        ["b"],
+        ["c"],
+    ]
+    assert peak == 2
+    assert attempts["limited"] == 2
+    assert attempts["broken"] == 1
+
+
+def test_session_pool_reuses_apps_with_fresh_history(monkeypatch):
+    started, stopped = [], []
+
+    class FakeAgent:
+        @asynccontextmanager
+        async def run(self):
+            app = {name: MagicMock() for name in ("generator", "evaluator")}
+            started.append(app)
+            yield app
+            stopped.append(app)
+
+    monkeypatch.setattr(hypo_query_generation, "build_query_gen_agent", FakeAgent)
+    pool = hypo_query_generation.AgentSessionPool(size=2)
+
+    async def use_session():
+        async with pool.session() as app:
+            return app
+
+    try:
+        used = [pool.run(use_session()) for _ in range(3)]
+    finally:
+        pool.close()
+
+    assert len(started) == 2
+    assert all(app in started for app in used)
+    assert used[0]["generator"].llm.history.clear.called
+    assert stopped == started[::-1]
+
+
+def test_clear_history_empties_the_llm_histories():
+    passthrough = pytest.importorskip("fast_agent.llm.internal.passthrough")
+    from fast_agent.agents.agent_types import AgentConfig
+    from fast_agent.agents.llm_agent import LlmAgent
+
+    agent = {
+        name: LlmAgent(AgentConfig(name=name)) for name in ("generator", "evaluator")
+    }
+
+    async def generate_then_clear():
+        for llm_agent in agent.values():
+            await llm_agent.attach_llm(passthrough.PassthroughLLM)
+            await llm_agent.generate("cloud computing benefits")
+        hypo_query_generation.clear_history(agent)
+
+    asyncio.run(generate_then_clear())
+
+    for llm_agent in agent.values():
+        assert llm_agent.message_history == []
+        assert llm_agent.llm.history.get() == []
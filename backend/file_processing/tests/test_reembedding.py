@@ -0,0 +1,100 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from file_processing import reembedding, utils
+from file_processing.embedders import Embedder, embed_in_batches
+from file_processing.generations import current_generation
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+from file_processing.result_cache import SEARCH_INDEX_GENERATION
+
+
+def test_reembedding_is_resumable(db):
+    owner = User.objects.create(username="owner")
+    ks = KnowledgeSource.objects.create(owner=owner, file="owner/a.pdf")
+    chunk = Chunk.objects.create(knowledge_source=ks, digest_hash="a")
+    for query in ("first", "second", "third", ""):
+        QueryVector.objects.create(
+            knowledge_source=ks,
+            chunk=chunk,
+            query=query,
+            vector=[1, 0, 0],
+            embedding_model="old",
+        )
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        return [[len(text), 1] for text in texts]
+
+    target = Embedder("new", 2, embed)
+
+    assert reembedding.reembed_batch("old", target, batch_size=2) == 2
+    assert reembedding.reembed_batch("old", target, batch_size=2) == 1
+    assert reembedding.reembed_batch("old", target, batch_size=2) == 0
+    assert calls == [["first", "second"], ["third"]]
+    reembedded = QueryVector.objects.filter(embedding_model="new")
+    assert sorted(reembedded.values_list("query", flat=True)) == [
+        "first",
+        "second",
+        "third",
+    ]
+
+
+def test_closest_rows_across_models():
+    rows = [
+        {"query_index": 0, "chunk_id": 1, "distance": 0.3},
+        {"query_index": 0, "chunk_id": 1, "distance": 0.1},
+        {"query_index": 1, "chunk_id": 1, "distance": 0.2},
+    ]
+
+    assert utils.closest_rows(rows) == rows[1:]
+
+
+def test_embed_in_batches_respects_the_provider_limit(settings):
+    settings.EMBEDDING_BATCH_SIZE = 256
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[1.0] for _ in texts]
+
+    embedder = Embedder("model", 1, embed, max_batch_size=2)
+
+    assert len(embed_in_batches(embedder, ["a", "b", "c", "d", "e"])) == 5
+    assert calls == [2, 2, 1]
+
+
+def test_source_vectors_without_query_are_not_deleted(db):
+    owner = User.objects.create(username="owner")
+    ks = KnowledgeSource.objects.create(owner=owner, file="owner/a.pdf")
+    chunk = Chunk.objects.create(knowledge_source=ks, digest_hash="a")
+    QueryVector.objects.bulk_create(
+        QueryVector(
+            knowledge_source=ks,
+            chunk=chunk,
+            query=query,
+            vector=[1, 0],
+            embedding_model="text-embedding-3-large",
+        )
+        for query in ["", "", "", "", ""]
+    )
+    stderr = StringIO()
+
+    call_command(
+        "reembed_queries",
+        "text-embedding-3-large",
+        "text-embedding-3-small",
+        "--skip-indexes",
+        "--delete-source",
+        stderr=stderr,
+    )
+
+    assert "5 vectors" in stderr.getvalue()
+    assert QueryVector.objects.count() == 5
+
+    generation = current_generation(SEARCH_INDEX_GENERATION)
+    assert reembedding.delete_vectors("text-embedding-3-large", batch_size=2) == 5
+    assert not QueryVector.objects.exists()
+    assert current_generation(SEARCH_INDEX_GENERATION) == generation + 1
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+from file_processing.generations import current_generation
+from file_processing.reindexing import is_indexed, remove_stale_chunks
+from file_processing.result_cache import SEARCH_INDEX_GENERATION
+
+
+def test_new_version_keeps_unchanged_chunks_only(db):
+    owner = User.objects.create(username="owner")
+    ks = KnowledgeSource.objects.create(owner=owner, file="owner/manual.pdf")
+    other = KnowledgeSource.objects.create(owner=owner, file="owner/other.pdf")
+    chunks = {
+        digest: Chunk.objects.create(knowledge_source=ks, digest_hash=digest)
+        for digest in ("kept", "edited")
+    }
+    elsewhere = Chunk.objects.create(knowledge_source=other, digest_hash="edited")
+    for chunk in (*chunks.values(), elsewhere):
+        QueryVector.objects.create(
+            knowledge_source=chunk.knowledge_source,
+            chunk=chunk,
+            query="query",
+            vector=[1, 0],
+            embedding_model="model",
+        )
+    added = Chunk.objects.create(knowledge_source=ks, digest_hash="added")
+
+    assert remove_stale_chunks(ks, ["kept", "added"]) == 1
+
+    assert set(
+        Chunk.objects.filter(knowledge_source=ks).values_list("digest_hash", flat=True)
+    ) == {"kept", "added"}
+    assert QueryVector.objects.filter(knowledge_source=ks).count() == 1
+    assert is_indexed(chunks["kept"], "model")
+    assert not is_indexed(added, "model")
+    assert is_indexed(elsewhere, "model")
+
+
+def test_cascading_delete_does_not_scale_with_the_rows(db):
+    owner = User.objects.create(username="owner")
+
+    def delete_source(vectors: int) -> int:
+        ks = KnowledgeSource.objects.create(owner=owner, file=f"owner/{vectors}.pdf")
+        chunk = Chunk.objects.create(knowledge_source=ks, digest_hash="digest")
+        QueryVector.objects.bulk_create(
+            QueryVector(
+                knowledge_source=ks, chunk=chunk, vector=[1, 0], embedding_model="m"
+            )
+            for _ in range(vectors)
+        )
+        generation = current_generation(SEARCH_INDEX_GENERATION)
+        with CaptureQueriesContext(connection) as queries:
+            ks.delete()
+        assert current_generation(SEARCH_INDEX_GENERATION) == generation + 1
+        return len(queries)
+
+    # Creates the generation rows and caches the content type
+    delete_source(1)
+    assert delete_source(200) == delete_source(2)
@@ -0,0 +1,67 @@
+from importlib.util import find_spec
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from file_processing import reranking
+from file_processing.views.retrieve_chunks import RetrieveTextForQuerySerializer
+
+
+def hit(chunk_id, score, content):
+    return {"chunk_id": chunk_id, "score": score, "content": content}
+
+
+def test_bm25_rewards_exact_terms():
+    [scores] = reranking.bm25_scores(
+        ["error E1234 on upload"],
+        [
+            ["uploads may fail for many reasons", "the E1234 error means quota"],
+        ],
+    )
+
+    assert scores[1] > scores[0]
+
+
+def test_rerank_replaces_scores_and_order():
+    ranked = [[hit(1, 0.9, "unrelated text"), hit(2, 0.8, "rotate the signing keys")]]
+
+    [hits] = reranking.rerank(["rotate keys"], ranked, top_k=2, reranker="bm25")
+
+    assert [h["chunk_id"] for h in hits] == [2, 1]
+    assert hits[1]["score"] == 0
+
+
+def test_maximal_marginal_relevance_skips_near_duplicates():
+    hits = [
+        hit(1, 0.9, "how to rotate the signing keys"),
+        hit(2, 0.89, "how to rotate the signing keys quickly"),
+        hit(3, 0.7, "audit logs retention"),
+    ]
+
+    picked = reranking.maximal_marginal_relevance(hits, top_k=2, diversity=0.7)
+
+    assert [h["chunk_id"] for h in picked] == [1, 3]
+
+
+def test_cross_encoder_unavailable_without_its_module(monkeypatch):
+    monkeypatch.setattr(reranking, "find_spec", lambda name: None)
+    reranking.available_rerankers.cache_clear()
+    try:
+        assert reranking.available_rerankers() == ["bm25"]
+        with pytest.raises(ImproperlyConfigured):
+            reranking.resolve_reranking("cross_encoder")
+    finally:
+        reranking.available_rerankers.cache_clear()
+
+
+@pytest.mark.skipif(
+    find_spec("sentence_transformers") is not None,
+    reason="sentence-transformers is installed",
+)
+def test_unavailable_reranker_is_a_bad_request():
+    serializer = RetrieveTextForQuerySerializer(
+        data={"query": "rotate keys", "reranker": "cross_encoder"}
+    )
+
+    assert not serializer.is_valid()
+    assert "reranker" in serializer.errors
@@ -0,0 +1,204 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from file_processing import lexical_search, utils
+
+
+@pytest.fixture
+def private_mount(settings, tmp_path):
+    settings.PRIVATE_MOUNT = tmp_path
+    utils.chunk_bodies.clear()
+    chunks = tmp_path / "process-results" / "some-id" / "chunks"
+    chunks.mkdir(parents=True)
+    for digest in ("a", "b", "c"):
+        with open(chunks / f"{digest}.json", "w") as f:
+            json.dump({"digest_hash": digest, "text": f"answer {digest}"}, f)
+    return tmp_path
+
+
+def test_chunk_contents_keeps_order(private_mount):
+    names = [f"process-results/some-id/chunks/{digest}.json" for digest in "cab"]
+
+    assert utils.chunk_contents(names) == ["answer c", "answer a", "answer b"]
+
+
+def test_chunk_content_is_cached(private_mount):
+    name = "process-results/some-id/chunks/a.json"
+    utils.chunk_content(name)
+
+    with patch("file_processing.utils.read_chunk_content") as mock_read:
+        assert utils.chunk_content(name) == "answer a"
+    mock_read.assert_not_called()
+
+
+def test_failed_chunk_reads_are_not_cached(private_mount):
+    name = "process-results/some-id/chunks/d.json"
+    assert utils.chunk_content(name) == ""
+
+    with open(private_mount / name, "w") as f:
+        json.dump({"digest_hash": "d", "text": "answer d"}, f)
+
+    assert utils.chunk_content(name) == "answer d"
+
+
+def test_deduplicate_hits_keeps_best_query():
+    ranked = [
+        [{"chunk_id": 2, "score": 0.9}, {"chunk_id": 1, "score": 0.7}],
+        [{"chunk_id": 1, "score": 0.8}, {"chunk_id": 3, "score": 0.6}],
+    ]
+
+    assert utils.deduplicate_hits(ranked) == [[ranked[0][0]], ranked[1]]
+
+
+def test_rank_hits_fuses_lexical_and_vector_rankings(settings):
+    settings.RETRIEVAL_RRF_K = 0
+    vector_rows = [
+        {"chunk_id": 2, "distance": 0.2, "query_index": 0},
+        {"chunk_id": 1, "distance": 0.1, "query_index": 0},
+    ]
+    lexical_rows = {0: [[{"id": 2, "file": "2.json", "text": ""}], []]}
+
+    [hits] = utils.rank_hits(["hybrid"], vector_rows, lexical_rows, top_k=2)
+
+    assert [hit["chunk_id"] for hit in hits] == [2, 1]
+    assert [hit["score"] for hit in hits] == [1 / 2 + 1, 1]
+
+
+@pytest.mark.parametrize(
+    "query, mode",
+    [
+        ("ERR_SSL_PROTOCOL_ERROR", "lexical"),
+        ("getUserById", "lexical"),
+        ("v2.3.1", "lexical"),
+        ("how to rotate the keys", "hybrid"),
+        ("kubernetes", "hybrid"),
+    ],
+)
+def test_auto_retrieval_mode(settings, query, mode):
+    settings.RETRIEVAL_MODE = "auto"
+
+    assert lexical_search.retrieval_mode(query) == mode
+
+
+def test_dense_retrieval_by_default():
+    assert lexical_search.retrieval_mode("ERR_SSL_PROTOCOL_ERROR") == "vector"
+    assert lexical_search.retrieval_mode("v2.3.1", mode="auto") == "lexical"
+
+
+@pytest.fixture
+def hnsw_settings(settings):
+    settings.HNSW_EF_SEARCH = 40
+    settings.HNSW_ITERATIVE_SCAN = ""
+    settings.RETRIEVAL_CANDIDATES_PER_CHUNK = 5
+    settings.RETRIEVAL_RERANK_OVERSAMPLING = 2
+    return settings
+
+
+def test_ef_search_covers_the_shortlist(hnsw_settings):
+    assert utils.effective_ef_search(2) == 40
+    assert utils.effective_ef_search(2, ef_search=100) == 100
+    assert utils.effective_ef_search(10) == 100
+    assert utils.effective_ef_search(10, ef_search=20) == 100
+    assert utils.vector_search_configuration(100) == {"hnsw.ef_search": "100"}
+
+
+def test_shortlist_is_capped_without_iterative_scan(hnsw_settings):
+    # 100 reranked results: 500 chunk candidates, 5000 query vectors
+    assert utils.first_pass_candidates(500) == utils.MAX_EF_SEARCH
+    assert utils.effective_ef_search(500) == utils.MAX_EF_SEARCH
+
+    hnsw_settings.HNSW_ITERATIVE_SCAN = "relaxed_order"
+    assert utils.first_pass_candidates(500) == 5000
+    assert utils.effective_ef_search(500) == utils.MAX_EF_SEARCH
+    assert utils.vector_search_configuration(utils.MAX_EF_SEARCH) == {
+        "hnsw.ef_search": "1000",
+        "hnsw.iterative_scan": "relaxed_order",
+    }
+
+
+def test_stream_with_contents_keeps_rank_order(settings, private_mount):
+    settings.CHUNK_STREAM_PREFETCH = 2
+    hits = [
+        {"chunk__file": f"process-results/some-id/chunks/{digest}.json", "score": 1}
+        for digest in "cab"
+    ]
+    for hit in hits:
+        hit["chunk__text"] = ""
+    hits[1]["chunk__text"] = "stored a"
+
+    async def collect():
+        return [chunk.content async for chunk in utils.stream_with_contents(hits)]
+
+    assert asyncio.run(collect()) == ["answer c", "stored a", "answer b"]
+
+
+def test_unreadable_chunks_are_left_out(settings, private_mount):
+    hits = [
+        {"chunk_id": index, "chunk__file": name, "chunk__text": "", "score": score}
+        for index, (name, score) in enumerate(
+            [
+                ("process-results/some-id/chunks/a.json", 0.9),
+                ("process-results/some-id/queries/legacy.xml", 0.8),
+                ("process-results/some-id/chunks/b.json", 0.7),
+            ]
+        )
+    ]
+    read = {hit["chunk__file"]: utils.chunk_content(hit["chunk__file"]) for hit in hits}
+
+    [chunks] = utils.finish_ranking(["query"], [hits], read, 2, False, None, 0.0)
+
+    assert [chunk.content for chunk in chunks] == ["answer a", "answer b"]
+
+
+@pytest.fixture
+def result_cache(db):
+    from file_processing import result_cache
+
+    result_cache.results.clear()
+    return result_cache
+
+
+def test_result_cache_serves_repeated_queries(result_cache):
+    chunks = [utils.RetrievedChunk(file="a.json", score=1, content="answer a")]
+    with (
+        patch("file_processing.result_cache.accessible_knowledge_source_ids") as scope,
+        patch(
+            "file_processing.utils.search_chunks_batch", return_value=[chunks]
+        ) as mock_search,
+    ):
+        scope.return_value = frozenset({1, 2})
+        utils.retrieve_relevant_queries_subject_filtered("alice", "cloud  costs", 3)
+        cached = utils.retrieve_relevant_queries_subject_filtered(
+            "bob", " cloud costs", 3
+        )
+        assert cached == chunks
+        assert mock_search.call_count == 1
+
+        result_cache.invalidate_search_index()
+        utils.retrieve_relevant_queries_subject_filtered("alice", "cloud costs", 3)
+        scope.return_value = frozenset({1})
+        utils.retrieve_relevant_queries_subject_filtered("alice", "cloud costs", 3)
+    assert mock_search.call_count == 3
+
+
+def test_streamed_results_are_cached(result_cache, settings):
+    settings.RESULT_CACHE_MAX_CHARACTERS = 10_000
+    hits = [{"chunk__file": "a.json", "chunk__text": "answer a", "score": 1}]
+
+    async def stream():
+        chunks = await utils.astream_relevant_chunks("alice", "cloud costs", 3)
+        return [chunk async for chunk in chunks]
+
+    with (
+        patch.object(result_cache, "result_keys", return_value=["key"]),
+        patch(
+            "file_processing.utils.arank_candidates", return_value=[hits]
+        ) as mock_rank,
+    ):
+        streamed = asyncio.run(stream())
+        assert asyncio.run(stream()) == streamed
+    assert [chunk.content for chunk in streamed] == ["answer a"]
+    assert mock_rank.call_count == 1
@@ -0,0 +1,107 @@
+import pytest
+from unittest.mock import patch
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import reverse
+
+from file_processing import utils
+from file_processing.models import QueryVector
+
+
+def hit(chunk_id, score):
+    return {
+        "chunk_id": chunk_id,
+        "chunk__file": f"results/chunks/{chunk_id}.json",
+        "chunk__text": f"chunk {chunk_id}",
+        "score": score,
+    }
+
+
+@pytest.fixture
+def client(db, settings):
+    settings.RESULT_CACHE_MAX_CHARACTERS = 0
+    settings.RERANKER = "none"
+    settings.RERANK_DIVERSITY = 0.0
+    client = APIClient()
+    client.force_authenticate(User.objects.create(username="alice"))
+    return client
+
+
+@pytest.fixture
+def mock_rank():
+    # The chunk 2 is shared by both queries, and scores best for the second one
+    ranked = [[hit(1, 0.9), hit(2, 0.5), hit(3, 0.4)], [hit(2, 0.8), hit(4, 0.3)]]
+    with patch("file_processing.utils.arank_candidates", return_value=ranked) as mock:
+        yield mock
+
+
+def test_batch_returns_results_in_query_order(client, mock_rank):
+    response = client.post(
+        reverse("retrieve-chunks-batch"),
+        {"queries": ["first", "second"], "top_k": 3},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "results": [
+            {"contents": ["chunk 1", "chunk 2", "chunk 3"], "scores": [0.9, 0.5, 0.4]},
+            {"contents": ["chunk 2", "chunk 4"], "scores": [0.8, 0.3]},
+        ]
+    }
+    subject, queries, modes, candidates, ef_search = mock_rank.call_args.args
+    assert (subject, queries, candidates) == ("alice", ["first", "second"], 3)
+
+
+def test_batch_deduplicates_chunks_across_queries(client, mock_rank):
+    response = client.post(
+        reverse("retrieve-chunks-batch"),
+        {"queries": ["first", "second"], "top_k": 3, "deduplicate": True},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["contents"] for result in response.json()["results"]] == [
+        ["chunk 1", "chunk 3"],
+        ["chunk 2", "chunk 4"],
+    ]
+
+
+def test_batch_top_k_applies_to_every_query(client, mock_rank):
+    response = client.post(
+        reverse("retrieve-chunks-batch"),
+        {"queries": ["first", "second"], "top_k": 1},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["contents"] for result in response.json()["results"]] == [
+        ["chunk 1"],
+        ["chunk 2"],
+    ]
+    assert mock_rank.call_args.args[3] == 1
+
+
+@pytest.mark.parametrize("queries", [[], [f"query {index}" for index in range(33)]])
+def test_batch_rejects_empty_or_oversized_query_lists(client, mock_rank, queries):
+    response = client.post(
+        reverse("retrieve-chunks-batch"), {"queries": queries}, format="json"
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "queries" in response.json()
+    mock_rank.assert_not_called()
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql", reason="Requires compound statement slicing"
+)
+def test_batch_is_ranked_in_a_single_statement():
+    ranked = utils.rank_chunks_for_queries(
+        QueryVector.objects.all(), [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], 5
+    )
+
+    assert str(ranked.query).count("UNION ALL") == 2
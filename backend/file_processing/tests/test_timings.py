@@ -0,0 +1,29 @@
+from django.http import HttpResponse
+
+from file_processing import timings
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = timings.Histogram([0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [("0.1", 2), ("1", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+
+
+def test_middleware_reports_stage_timings(settings):
+    settings.SERVER_TIMING_HEADER = True
+
+    def view(request):
+        with timings.stage("embedding"):
+            pass
+        return HttpResponse()
+
+    request = type("Request", (), {"path": "/get-chunks/"})()
+    response = timings.server_timing_middleware(view)(request)
+
+    assert response["Server-Timing"].startswith("embedding;dur=")
+    assert 'retrieval_stage_seconds_count{stage="embedding"}' in (
+        timings.prometheus_text()
+    )
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+
+from file_processing import lexical_search, vector_index
+from file_processing.models import Chunk, KnowledgeSource, QueryVector, VectorField
+from file_processing.result_cache import invalidate_search_index
+
+
+def add_chunk(knowledge_source, digest, vectors, model="text-embedding-3-large"):
+    chunk = Chunk.objects.create(
+        knowledge_source=knowledge_source,
+        digest_hash=digest,
+        file=f"chunks/{digest}.json",
+        text=f"text {digest}",
+    )
+    for vector in vectors:
+        QueryVector.objects.create(
+            knowledge_source=knowledge_source,
+            chunk=chunk,
+            vector=vector,
+            embedding_model=model,
+        )
+    invalidate_search_index()
+    return chunk
+
+
+@pytest.fixture
+def knowledge_sources(db):
+    # Generations restart with every test transaction
+    vector_index._indexes.clear()
+    owner = User.objects.create(username="owner")
+    ks_a, ks_b = [
+        KnowledgeSource.objects.create(owner=owner, file=f"owner/{name}")
+        for name in ("a.pdf", "b.pdf")
+    ]
+    add_chunk(ks_a, "a1", [[1, 0, 0], [0, 1, 0]])
+    add_chunk(ks_a, "a2", [[0, 0, 1]])
+    add_chunk(ks_b, "b1", [[1, 0.1, 0]])
+    return ks_a, ks_b
+
+
+def test_nearest_chunks_per_query_within_access(knowledge_sources):
+    ks_a, _ = knowledge_sources
+
+    hits = vector_index.nearest_chunks({ks_a.pk}, [[2, 0, 0], [0, 0.1, 1]], top_k=1)
+
+    assert [(hit["chunk__file"], hit["query_index"]) for hit in hits] == [
+        ("chunks/a1.json", 0),
+        ("chunks/a2.json", 1),
+    ]
+    assert hits[0]["distance"] == pytest.approx(0)
+    assert hits[0]["chunk__text"] == "text a1"
+
+
+def test_nearest_chunks_groups_queries_of_a_chunk(knowledge_sources):
+    ks_a, ks_b = knowledge_sources
+
+    hits = vector_index.nearest_chunks({ks_a.pk, ks_b.pk}, [[0, 1, 0]], top_k=5)
+
+    assert [hit["chunk__file"] for hit in hits] == [
+        "chunks/a1.json",
+        "chunks/b1.json",
+        "chunks/a2.json",
+    ]
+
+
+def test_vector_index_reloaded_after_write(knowledge_sources):
+    ks_a, _ = knowledge_sources
+    vector_index.nearest_chunks({ks_a.pk}, [[1, 1, 1]], top_k=1)
+
+    add_chunk(ks_a, "a3", [[1, 1, 1]])
+    hits = vector_index.nearest_chunks({ks_a.pk}, [[1, 1, 1]], top_k=1)
+
+    assert hits[0]["chunk__file"] == "chunks/a3.json"
+
+
+def test_nearest_chunks_of_the_embedding_model(knowledge_sources):
+    ks_a, _ = knowledge_sources
+    add_chunk(ks_a, "small", [[1, 0]], model="text-embedding-3-small")
+
+    large = vector_index.nearest_chunks({ks_a.pk}, [[1, 0, 0]], top_k=5)
+    small = vector_index.nearest_chunks(
+        {ks_a.pk}, [[1, 0]], top_k=5, embedding_model="text-embedding-3-small"
+    )
+
+    assert "chunks/small.json" not in [hit["chunk__file"] for hit in large]
+    assert [hit["chunk__file"] for hit in small] == ["chunks/small.json"]
+
+
+@pytest.mark.skipif(
+    connection.vendor != "sqlite", reason="a pgvector `vector` on PostgreSQL"
+)
+def test_vector_field_stores_packed_floats(knowledge_sources):
+    vector = QueryVector.objects.first().vector
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT vector FROM file_processing_queryvector LIMIT 1")
+        [stored] = cursor.fetchone()
+
+    assert len(stored) == 3 * 4
+    assert isinstance(vector, np.ndarray) and vector.dtype == np.float32
+
+
+def test_vector_field_half_precision():
+    field = VectorField(precision="half")
+    stored = np.asarray([0.5, -2.0], dtype="<f2").tobytes()
+
+    assert field.to_python(stored).tolist() == [0.5, -2.0]
+    assert field.deconstruct()[3]["precision"] == "half"
+
+
+def test_lexical_rankings_within_access(knowledge_sources):
+    ks_a, ks_b = knowledge_sources
+    chunk = Chunk.objects.get(digest_hash="a2")
+    chunk.text = "fails with ERR_SSL_PROTOCOL"
+    chunk.save()
+    QueryVector.objects.create(
+        knowledge_source=ks_b,
+        chunk=Chunk.objects.get(digest_hash="b1"),
+        query="ERR_SSL_PROTOCOL",
+    )
+
+    by_text, by_query = lexical_search.lexical_rankings(
+        {ks_a.pk}, "ERR_SSL_PROTOCOL", limit=5
+    )
+
+    assert [row["file"] for row in by_text] == ["chunks/a2.json"]
+    assert list(by_query) == []
@@ -0,0 +1,162 @@
+"""
+Latency of the stages of the retrieval (access scope, embedding, searches,
+chunk reads, reranking).
+
+Every `stage` adds its duration to a histogram of the process, exported in
+the Prometheus text format by the `/metrics/` view (with the counters of the
+query embedding caches), and to the timings of
+the current request, which `server_timing_middleware` logs as structured
+fields and returns in the `Server-Timing` header. Stages running
+concurrently are each timed in full. The chunks of a streamed response are
+read after its headers are sent, so those reads only reach the histograms.
+"""
+
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from file_processing.embedders import query_embedding_caches
+from file_processing.embedding_cache import prometheus_lines
+
+
+logger = logging.getLogger(__name__)
+
+# stage -> seconds, of the request being handled
+request_timings: ContextVar[dict[str, float] | None] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class Histogram:
+    """Cumulative histogram of observed durations, in seconds"""
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        with self._lock:
+            counts = list(self.counts)
+        bounds = [*(str(bucket) for bucket in self.buckets), "+Inf"]
+        total, cumulative = 0, []
+        for bound, count in zip(bounds, counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+stage_histograms: dict[str, Histogram] = {}
+_histograms_lock = Lock()
+
+
+def histogram(name: str) -> Histogram:
+    with _histograms_lock:
+        if name not in stage_histograms:
+            stage_histograms[name] = Histogram(settings.RETRIEVAL_TIMING_BUCKETS)
+        return stage_histograms[name]
+
+
+def record(name: str, seconds: float):
+    histogram(name).observe(seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Times the block (or the decorated function) as the `name` stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP retrieval_stage_seconds Duration of the retrieval stages",
+        "# TYPE retrieval_stage_seconds histogram",
+    ]
+    with _histograms_lock:
+        histograms = sorted(stage_histograms.items())
+    for name, stage_histogram in histograms:
+        for bound, count in stage_histogram.cumulative_counts():
+            lines.append(
+                f'retrieval_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}'
+            )
+        lines.append(
+            f'retrieval_stage_seconds_sum{{stage="{name}"}} {stage_histogram.sum}'
+        )
+        lines.append(
+            f'retrieval_stage_seconds_count{{stage="{name}"}} {stage_histogram.count}'
+        )
+    lines += prometheus_lines(query_embedding_caches)
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings: dict[str, float]) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+
+
+def report_timings(request, response, timings: dict[str, float]):
+    if not timings:
+        return response
+    logger.info(
+        f"Timed {request.path}",
+        extra={
+            "path": request.path,
+            "status": response.status_code,
+            "timings_ms": {
+                name: round(seconds * 1000, 1) for name, seconds in timings.items()
+            },
+        },
+    )
+    if settings.SERVER_TIMING_HEADER:
+        response["Server-Timing"] = server_timing(timings)
+    return response
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timings = {}
+            token = request_timings.set(timings)
+            try:
+                response = await get_response(request)
+            finally:
+                request_timings.reset(token)
+            return report_timings(request, response, timings)
+
+    else:
+
+        def middleware(request):
+            timings = {}
+            token = request_timings.set(timings)
+            try:
+                response = get_response(request)
+            finally:
+                request_timings.reset(token)
+            return report_timings(request, response, timings)
+
+    return middleware
@@ -1,6 +1,10 @@
 from django.urls import path
 from .views.eventarc import EventarcHandler
-from .views.retrieve_chunks import RetrieveTextForQueryAPIView
+from .views.metrics import MetricsView
+from .views.retrieve_chunks import (
+    RetrieveTextForQueriesAPIView,
+    RetrieveTextForQueryAPIView,
+)
 from .views.signed_urls import SignedURLUploadView
 
 urlpatterns = [
@@ -10,5 +14,11 @@ urlpatterns = [
         RetrieveTextForQueryAPIView.as_view(),
         name="retrieve-chunks",
     ),
+    path(
+        "get-chunks/batch/",
+        RetrieveTextForQueriesAPIView.as_view(),
+        name="retrieve-chunks-batch",
+    ),
     path("signed-url/", SignedURLUploadView.as_view(), name="signed-url-upload"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
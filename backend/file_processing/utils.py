@@ -1,89 +1,769 @@
-from openai import OpenAI
-from content_access_control import core
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import FloatField, Min, Value
 from django.db.models.query import QuerySet
 from django.db.models.expressions import RawSQL
 from django.conf import settings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator
+import asyncio
 import json
+import logging
 
+from file_processing import (
+    async_db,
+    lexical_search,
+    reranking,
+    result_cache,
+    vector_index,
+)
+from file_processing.timings import stage
+from file_processing.caching import LRUCache
 from file_processing.models import QueryVector
+from file_processing.embedders import (  # noqa: F401
+    aembed_content,
+    embed_content,
+    embed_content_gemini,
+    query_embedding_cache,
+    read_embedders,
+)
+from file_processing.access_scopes import (  # noqa: F401
+    accessible_knowledge_source_ids,
+    materialized_access_scope,
+    policies_assigned_to_subject,
+    subject_accessible_knowledge_sources,
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 def generate_upload_blob_name(username, file_name):
     return f"django-uploads/{username}/{file_name}"
 
 
-def embed_content(content: str | list[str]) -> list[list[float] | None]:
-    client = OpenAI()
+def accessible_knowledge_sources(
+    subject_identifier: str, access_filter: str | None = None
+) -> QuerySet | frozenset[int]:
+    """
+    Ids of the knowledge sources the subject can access, to filter with.
+
+    With the "join" access filter, the scope is a subquery over the
+    materialized access table, planned by the database together with the
+    search; with "in_list" the ids are sent as query parameters.
+    """
+    access_filter = access_filter or settings.RETRIEVAL_ACCESS_FILTER
+    if access_filter == "join":
+        return materialized_access_scope(subject_identifier)
+    return accessible_knowledge_source_ids(subject_identifier)
+
+
+def filter_queries_by_subject_access(
+    subject_identifier: str, access_filter: str | None = None
+) -> QuerySet[QueryVector]:
+    """Query vectors of the knowledge sources the subject can access"""
+    ks_ids = accessible_knowledge_sources(subject_identifier, access_filter)
+    return QueryVector.objects.filter(knowledge_source__id__in=ks_ids)
 
-    response = client.embeddings.create(input=content, model="text-embedding-3-large")
-    data = response.data
-    return [embedding.embedding for embedding in data]
 
+# Compact copies of the vectors the ANN indexes are built over (see
+# `ann_indexes`): the Matryoshka prefix of the embedding as halfvec, or its sign
+# bits. Formatted with the number of `dimensions` of the embedding model.
+FIRST_PASS_DIMENSIONS = 1024
+FIRST_PASS_DISTANCES = {
+    "subvector": (
+        "subvector(vector, 1, {prefix})::halfvec({prefix})"
+        " <=> subvector(%s::vector, 1, {prefix})::halfvec({prefix})"
+    ),
+    "binary": (
+        "binary_quantize(vector)::bit({dimensions})"
+        " <~> binary_quantize(%s::vector)::bit({dimensions})"
+    ),
+}
 
-def embed_content_gemini(content: str | list[str]) -> list[list[float] | None]:
-    from google import genai
 
-    client = genai.Client()
-    result = client.models.embed_content(model="gemini-embedding-001", contents=content)
-    data = result.embeddings
-    return [embedding.values for embedding in data]
+def vector_literal(embedding: list[float]) -> str:
+    return str([float(value) for value in embedding])
 
 
-def policies_assigned_to_subject(subject_identifier: str) -> list[list[str]]:
+def first_pass_distance(
+    embedding: list[float], first_pass: str | None = None
+) -> RawSQL:
+    """
+    Approximate distance between the stored vector and `embedding`, expressed
+    exactly as the compact ANN index of the embedding model is defined,
+    otherwise the planner falls back to a sequential scan.
     """
-    Function that retrieves all permission policies assigned to a subject.
+    first_pass = first_pass or settings.RETRIEVAL_FIRST_PASS
+    dimensions = len(embedding)
+    distance = FIRST_PASS_DISTANCES[first_pass].format(
+        prefix=min(FIRST_PASS_DIMENSIONS, dimensions), dimensions=dimensions
+    )
+    return RawSQL(distance, [vector_literal(embedding)], output_field=FloatField())
+
+
+def cosine_distance(embedding: list[float]) -> RawSQL:
+    """Exact cosine distance between the full precision stored vector and `embedding`"""
+    return RawSQL(
+        "vector <=> %s::vector", [vector_literal(embedding)], output_field=FloatField()
+    )
+
+
+def sort_queries_by_relevance(
+    queries: QuerySet[QueryVector],
+    embedding: list[float],
+    first_pass: str | None = None,
+) -> QuerySet[QueryVector]:
+    distance = first_pass_distance(embedding, first_pass)
+    return queries.annotate(distance=distance).order_by("distance")
 
-    Args:
-        subject_identifier (str): The identifier of the subject. Could be
-        `unique_object_instance_identifier` if object implements the
-        ObjectIdentifierMixin, or simply a username, if the Django User object
-        is linked to a subject as it should.
+
+# Upper bound of `hnsw.ef_search` in pgvector
+MAX_EF_SEARCH = 1000
+
+
+def first_pass_candidates(top_k: int) -> int:
+    candidates = (
+        top_k
+        * settings.RETRIEVAL_CANDIDATES_PER_CHUNK
+        * settings.RETRIEVAL_RERANK_OVERSAMPLING
+    )
+    if settings.HNSW_ITERATIVE_SCAN:
+        return candidates
+    # An HNSW scan never yields more than `ef_search` rows, unless iterative
+    return min(candidates, MAX_EF_SEARCH)
+
+
+def rank_chunks_by_relevance(
+    queries: QuerySet[QueryVector],
+    embedding: list[float],
+    top_k: int,
+    first_pass: str | None = None,
+) -> QuerySet:
     """
-    if not isinstance(subject_identifier, str):
-        raise ValueError("subject_identifier must be a string")
-    policies = core.enforcer.get_implicit_permissions_for_user(subject_identifier)
-    return policies
+    Returns the `top_k` most relevant distinct chunks as
+    `{"chunk_id", "chunk__file", "chunk__text", "distance"}` rows, where the
+    distance of a chunk is the best distance of its queries.
 
+    Every chunk owns many query vectors, so the nearest neighbours are first
+    over-fetched through the compact ANN index, then reranked with the exact
+    distance of the full vectors and grouped by chunk.
+    """
+    candidates = sort_queries_by_relevance(queries, embedding, first_pass)
+    candidates = candidates.values("pk")[: first_pass_candidates(top_k)]
+    return (
+        QueryVector.objects.filter(pk__in=candidates)
+        # The unresolved chunk of legacy vectors (see migration 0011)
+        .exclude(chunk__file="")
+        .values("chunk_id", "chunk__file", "chunk__text")
+        .annotate(distance=Min(cosine_distance(embedding)))
+        .order_by("distance")[:top_k]
+    )
 
-def subject_accessible_knowledge_sources(subject_identifier: str):
-    def filter_predicate(policy: list[str]):
-        return policy[1].startswith("file_processing:knowledgesource")
 
-    def get_knowledge_source_id(policy: list[str]):
-        return policy[1].split(":")[-1]
+def rank_chunks_for_queries(
+    queries: QuerySet[QueryVector], embeddings: list[list[float]], top_k: int
+) -> QuerySet:
+    """
+    `rank_chunks_by_relevance` for several query embeddings at once, as a
+    single UNION ALL statement. Every row carries the `query_index` of the
+    embedding it was ranked for; the order of the rows is unspecified.
+    """
+    ranked = [
+        rank_chunks_by_relevance(queries, embedding, top_k).annotate(
+            query_index=Value(index)
+        )
+        for index, embedding in enumerate(embeddings)
+    ]
+    if len(ranked) == 1:
+        return ranked[0]
+    return ranked[0].union(*ranked[1:], all=True)
 
-    policies = policies_assigned_to_subject(subject_identifier)
-    filtered_policies = filter(filter_predicate, policies)
-    ks_ids = map(get_knowledge_source_id, filtered_policies)
 
-    return ks_ids
+def nearest_chunks(
+    subject: str,
+    embeddings: list[list[float]],
+    top_k: int,
+    ef_search: int | None = None,
+    embedding_model: str | None = None,
+) -> list[dict]:
+    """
+    The `top_k` chunks accessible to the subject nearest to every embedding,
+    among the vectors of its embedding model (the active one by default).
+    Without pgvector the exact in-process search of `vector_index` is used.
+    """
+    embedding_model = embedding_model or settings.EMBEDDING_MODEL
+    if connection.vendor != "postgresql":
+        ks_ids = accessible_knowledge_source_ids(subject)
+        return vector_index.nearest_chunks(ks_ids, embeddings, top_k, embedding_model)
+    queries_accessible = filter_queries_by_subject_access(subject).filter(
+        embedding_model=embedding_model
+    )
+    ranked = rank_chunks_for_queries(queries_accessible, embeddings, top_k)
+    with vector_search_accuracy(effective_ef_search(top_k, ef_search)):
+        return list(ranked)
 
 
-def filter_queries_by_subject_access(subject_identifier: str) -> QuerySet[QueryVector]:
-    ks_ids = subject_accessible_knowledge_sources(subject_identifier)
-    return QueryVector.objects.filter(knowledge_source__id__in=ks_ids)
+def closest_rows(rows: list[dict]) -> list[dict]:
+    """
+    Keeps the nearest row of every chunk for every query, over the rows of
+    several embedding models (dual read during a re-embedding).
+    """
+    closest: dict[tuple[int, int], dict] = {}
+    for row in rows:
+        key = (row["query_index"], row["chunk_id"])
+        if key not in closest or row["distance"] < closest[key]["distance"]:
+            closest[key] = row
+    return list(closest.values())
 
 
-def sort_queries_by_relevance(
-    queries: QuerySet[QueryVector], embedding: list[float]
-) -> QuerySet[QueryVector]:
-    return queries.annotate(
-        distance=RawSQL("vector <=> %s", [str(embedding)])
-    ).order_by("distance")
+def effective_ef_search(top_k: int, ef_search: int | None = None) -> int:
+    # The scan needs a candidate list as long as the shortlist it fills
+    candidates = first_pass_candidates(top_k)
+    return min(max(ef_search or settings.HNSW_EF_SEARCH, candidates), MAX_EF_SEARCH)
 
 
-def chunk_content(chunk_name: str):
+def vector_search_configuration(ef_search: int) -> dict[str, str]:
+    """Run-time parameters of the HNSW index scan"""
+    configuration = {"hnsw.ef_search": str(ef_search)}
+    if settings.HNSW_ITERATIVE_SCAN:
+        configuration["hnsw.iterative_scan"] = settings.HNSW_ITERATIVE_SCAN
+    return configuration
+
+
+@contextmanager
+def vector_search_accuracy(ef_search: int):
+    """
+    Applies `hnsw.ef_search` (and `hnsw.iterative_scan`, if configured) to the
+    vector queries evaluated inside the block.
+
+    The settings are transaction scoped (`SET LOCAL`), so they never leak to
+    other requests sharing the pooled connection. No-op outside of PostgreSQL.
+    """
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for name, value in vector_search_configuration(ef_search).items():
+                cursor.execute("SELECT set_config(%s, %s, true)", [name, value])
+        yield
+
+
+# Chunk files are named by the digest of their content and written once, into
+# a fresh processing directory, so a path always identifies the same body.
+chunk_bodies = LRUCache(settings.CHUNK_CACHE_MAX_CHARACTERS, weigh=len)
+chunk_reader = ThreadPoolExecutor(
+    max_workers=settings.CHUNK_READER_THREADS, thread_name_prefix="chunk-reader"
+)
+
+
+def read_chunk_content(chunk_name: str) -> str | None:
+    """The body of the chunk file, None if it could not be read"""
     path = settings.PRIVATE_MOUNT / chunk_name
-    with open(path) as f:
-        file = json.load(f)
-    return file.get("answer", "")
-
-
-def retrieve_relevant_queries_subject_filtered(subject: str, query: str, top_k: int):
-    queries_accessible = filter_queries_by_subject_access(subject)
-    embedding = embed_content(query)
-    sorted = sort_queries_by_relevance(queries_accessible, embedding)
-    file_names = [chunk.file.name for chunk in sorted[:top_k]]
-    contents = map(chunk_content, file_names)
-    filtered_non_empty = list(map(lambda chunk: chunk, contents))
-    return filtered_non_empty
+    try:
+        with open(path) as f:
+            file = json.load(f)
+    except (OSError, ValueError):
+        logger.warning(f"Could not read the content of {chunk_name=}")
+        return None
+    return file.get("text", "")
+
+
+def chunk_content(chunk_name: str) -> str:
+    """The body of the chunk, "" if it could not be read (and then not cached)"""
+    content = chunk_bodies.get(chunk_name)
+    if content is None:
+        content = read_chunk_content(chunk_name)
+        if content is None:
+            # The mount may fail transiently: the next lookup reads again
+            return ""
+        chunk_bodies.set(chunk_name, content)
+    return content
+
+
+def chunk_contents(chunk_names: list[str]) -> list[str]:
+    """
+    Bodies of the chunks, in order. Each read from the mount is a remote
+    round trip, so the ones missing from the cache are fetched concurrently.
+    """
+    return list(chunk_reader.map(chunk_content, chunk_names))
+
+
+@dataclass
+class RetrievedChunk:
+    file: str
+    score: float
+    content: str
+
+
+def retrieved_chunks(hits: list[dict]) -> list[RetrievedChunk]:
+    return [
+        RetrievedChunk(
+            file=hit["chunk__file"], score=hit["score"], content=hit["content"]
+        )
+        for hit in hits
+    ]
+
+
+def unread_chunk_files(ranked: list[list[dict]]) -> list[str]:
+    # Chunks whose text could not be copied to the database are read from the mount
+    return list(
+        dict.fromkeys(
+            hit["chunk__file"]
+            for hits in ranked
+            for hit in hits
+            if not hit["chunk__text"]
+        )
+    )
+
+
+def rank_hits(
+    modes: list[str],
+    vector_rows: list[dict],
+    lexical_rows: dict[int, list[list[dict]]],
+    top_k: int,
+) -> list[list[dict]]:
+    """
+    The `top_k` hits of every query, best first, each with a "score": the
+    cosine similarity in the "vector" mode, the reciprocal rank fusion of the
+    vector and lexical rankings otherwise.
+
+    `vector_rows` are the rows of `nearest_chunks` for the queries not in the
+    "lexical" mode, in order; `lexical_rows` maps the index of every query not
+    in the "vector" mode to the rows of its `lexical_rankings`.
+    """
+    dense = [index for index, mode in enumerate(modes) if mode != "lexical"]
+    by_query = [[] for _ in modes]
+    for row in sorted(vector_rows, key=lambda row: row["distance"]):
+        index = dense[row["query_index"]]
+        by_query[index].append({**row, "score": 1 - row["distance"]})
+
+    ranked = []
+    for index, mode in enumerate(modes):
+        if mode == "vector":
+            ranked.append(by_query[index])
+            continue
+        rankings = [lexical_search.as_hits(rows) for rows in lexical_rows[index]]
+        ranked.append(
+            lexical_search.reciprocal_rank_fusion([by_query[index], *rankings], top_k)
+        )
+    return ranked
+
+
+def deduplicate_hits(ranked: list[list[dict]]) -> list[list[dict]]:
+    """Keeps every chunk only for the query it scored best for"""
+    best: dict[int, tuple[float, int]] = {}
+    for index, hits in enumerate(ranked):
+        for hit in hits:
+            if hit["chunk_id"] not in best or best[hit["chunk_id"]][0] < hit["score"]:
+                best[hit["chunk_id"]] = (hit["score"], index)
+    return [
+        [hit for hit in hits if best[hit["chunk_id"]][1] == index]
+        for index, hits in enumerate(ranked)
+    ]
+
+
+@stage("rerank")
+def finish_ranking(
+    queries: list[str],
+    ranked: list[list[dict]],
+    read: dict[str, str],
+    top_k: int,
+    deduplicate: bool,
+    reranker: str | None,
+    diversity: float,
+) -> list[list[RetrievedChunk]]:
+    """
+    Reranks the candidates of every query and keeps the `top_k` best, leaving
+    out the chunks whose content could not be read.
+    """
+    for hits in ranked:
+        for hit in hits:
+            hit["content"] = hit["chunk__text"] or read[hit["chunk__file"]]
+    ranked = [[hit for hit in hits if hit["content"]] for hits in ranked]
+    ranked = reranking.rerank(queries, ranked, top_k, reranker, diversity)
+    if deduplicate:
+        ranked = deduplicate_hits(ranked)
+    return [retrieved_chunks(hits[:top_k]) for hits in ranked]
+
+
+def dense_queries(queries: list[str], modes: list[str]) -> list[str]:
+    """The queries searched by vector, those not in the "lexical" mode"""
+    return [query for query, mode in zip(queries, modes) if mode != "lexical"]
+
+
+def lexical_query_indexes(modes: list[str]) -> list[int]:
+    """Indexes of the queries searched by keyword, those not in the "vector" mode"""
+    return [index for index, mode in enumerate(modes) if mode != "vector"]
+
+
+def search_plan(
+    queries: list[str],
+    top_k: int,
+    mode: str | None,
+    reranker: str | None,
+    diversity: float,
+) -> tuple[int, list[str]]:
+    """The candidates to rank for every query, and the retrieval mode of each"""
+    candidates = reranking.candidate_count(top_k, reranker, diversity)
+    return candidates, [lexical_search.retrieval_mode(query, mode) for query in queries]
+
+
+def rank_candidates(
+    subject: str,
+    queries: list[str],
+    modes: list[str],
+    candidates: int,
+    ef_search: int | None = None,
+) -> list[list[dict]]:
+    """The `candidates` best hits of every query (see `rank_hits`), without content"""
+    dense = dense_queries(queries, modes)
+    vector_rows = []
+    for embedder in read_embedders() if dense else []:
+        with stage("embedding"):
+            embeddings = query_embedding_cache(embedder.model).embed_many(dense)
+        with stage("vector_search"):
+            vector_rows += nearest_chunks(
+                subject, embeddings, candidates, ef_search, embedder.model
+            )
+    vector_rows = closest_rows(vector_rows)
+
+    lexical_rows = {}
+    lexical_indexes = lexical_query_indexes(modes)
+    if lexical_indexes:
+        ks_ids = accessible_knowledge_sources(subject)
+        for index in lexical_indexes:
+            rankings = lexical_search.lexical_rankings(
+                ks_ids, queries[index], candidates
+            )
+            with stage("lexical_search"):
+                lexical_rows[index] = [list(ranking) for ranking in rankings]
+
+    return rank_hits(modes, vector_rows, lexical_rows, candidates)
+
+
+def uses_result_cache(deduplicate: bool) -> bool:
+    # The chunks kept for a deduplicated query depend on the rest of the batch
+    return bool(settings.RESULT_CACHE_MAX_CHARACTERS) and not deduplicate
+
+
+def result_cache_options(
+    top_k: int,
+    ef_search: int | None,
+    mode: str | None,
+    reranker: str | None,
+    diversity: float,
+) -> dict:
+    return {
+        "top_k": top_k,
+        "ef_search": ef_search,
+        "mode": mode or settings.RETRIEVAL_MODE,
+        "reranker": reranker,
+        "diversity": diversity,
+    }
+
+
+def cached_batch(keys: list[str]) -> tuple[list, list[int]]:
+    """The cached results of the keys (None when missing), and the missing indexes"""
+    results = result_cache.cached_results(keys)
+    return results, [index for index, chunks in enumerate(results) if chunks is None]
+
+
+def remember_batch(
+    results: list, keys: list[str], missing: list[int], found: list
+) -> list[list[RetrievedChunk]]:
+    """Caches the results `found` for the `missing` queries, fills them in"""
+    result_cache.remember_results([keys[index] for index in missing], found)
+    for index, chunks in zip(missing, found):
+        results[index] = chunks
+    return results
+
+
+def search_chunks_batch(
+    subject: str,
+    queries: list[str],
+    top_k: int,
+    ef_search: int | None,
+    deduplicate: bool,
+    mode: str | None,
+    reranker: str | None,
+    diversity: float,
+) -> list[list[RetrievedChunk]]:
+    candidates, modes = search_plan(queries, top_k, mode, reranker, diversity)
+    ranked = rank_candidates(subject, queries, modes, candidates, ef_search)
+    unread = unread_chunk_files(ranked)
+    with stage("chunk_read"):
+        read = dict(zip(unread, chunk_contents(unread)))
+    return finish_ranking(
+        queries, ranked, read, top_k, deduplicate, reranker, diversity
+    )
+
+
+def retrieve_relevant_chunks_batch(
+    subject: str,
+    queries: list[str],
+    top_k: int,
+    ef_search: int | None = None,
+    deduplicate: bool = False,
+    mode: str | None = None,
+    reranker: str | None = None,
+    diversity: float | None = None,
+) -> list[list[RetrievedChunk]]:
+    reranker, diversity = reranking.resolve_reranking(reranker, diversity)
+    options = (top_k, ef_search, deduplicate, mode, reranker, diversity)
+    if not uses_result_cache(deduplicate):
+        return search_chunks_batch(subject, queries, *options)
+
+    keys = result_cache.result_keys(
+        subject,
+        queries,
+        **result_cache_options(top_k, ef_search, mode, reranker, diversity),
+    )
+    results, missing = cached_batch(keys)
+    if missing:
+        missing_queries = [queries[index] for index in missing]
+        found = search_chunks_batch(subject, missing_queries, *options)
+        remember_batch(results, keys, missing, found)
+    return results
+
+
+def retrieve_relevant_queries_subject_filtered(
+    subject: str,
+    query: str,
+    top_k: int,
+    ef_search: int | None = None,
+    mode: str | None = None,
+    reranker: str | None = None,
+    diversity: float | None = None,
+) -> list[RetrievedChunk]:
+    [chunks] = retrieve_relevant_chunks_batch(
+        subject,
+        [query],
+        top_k,
+        ef_search,
+        mode=mode,
+        reranker=reranker,
+        diversity=diversity,
+    )
+    return chunks
+
+
+async def arank_candidates(
+    subject: str,
+    queries: list[str],
+    modes: list[str],
+    candidates: int,
+    ef_search: int | None = None,
+) -> list[list[dict]]:
+    """
+    `rank_candidates` for the event loop: the embeddings missing from the cache
+    are requested in one API call, all the nearest neighbour lookups are sent
+    to the database as one statement, and the lexical searches run
+    concurrently with both.
+    """
+    if connection.vendor != "postgresql":
+        return await sync_to_async(rank_candidates)(
+            subject, queries, modes, candidates, ef_search
+        )
+    dense = dense_queries(queries, modes)
+    ks_ids = await async_db.run_blocking(accessible_knowledge_sources, subject)
+
+    async def fetch_vector_rows(embedding_model: str) -> list[dict]:
+        with stage("embedding"):
+            cache = query_embedding_cache(embedding_model)
+            embeddings = await cache.aembed_many(dense)
+        queries_accessible = QueryVector.objects.filter(
+            knowledge_source__id__in=ks_ids, embedding_model=embedding_model
+        )
+        ranked = rank_chunks_for_queries(queries_accessible, embeddings, candidates)
+        ef = effective_ef_search(candidates, ef_search)
+        with stage("vector_search"):
+            return await async_db.fetch_all(ranked, vector_search_configuration(ef))
+
+    async def fetch_lexical_rows(query: str) -> list[list[dict]]:
+        rankings = lexical_search.lexical_rankings(ks_ids, query, candidates)
+        with stage("lexical_search"):
+            return await asyncio.gather(
+                *(async_db.fetch_all(ranking) for ranking in rankings)
+            )
+
+    lexical_indexes = lexical_query_indexes(modes)
+    vector_fetches = [
+        fetch_vector_rows(embedder.model) for embedder in read_embedders() if dense
+    ]
+    lexical_fetches = [fetch_lexical_rows(queries[index]) for index in lexical_indexes]
+    results = await asyncio.gather(*vector_fetches, *lexical_fetches)
+    vector_rows = closest_rows(
+        [row for rows in results[: len(vector_fetches)] for row in rows]
+    )
+    lexical_rows = dict(zip(lexical_indexes, results[len(vector_fetches) :]))
+    return rank_hits(modes, vector_rows, lexical_rows, candidates)
+
+
+async def achunk_content(chunk_name: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chunk_reader, chunk_content, chunk_name)
+
+
+async def asearch_chunks_batch(
+    subject: str,
+    queries: list[str],
+    top_k: int,
+    ef_search: int | None,
+    deduplicate: bool,
+    mode: str | None,
+    reranker: str | None,
+    diversity: float,
+) -> list[list[RetrievedChunk]]:
+    candidates, modes = search_plan(queries, top_k, mode, reranker, diversity)
+    ranked = await arank_candidates(subject, queries, modes, candidates, ef_search)
+    unread = unread_chunk_files(ranked)
+    with stage("chunk_read"):
+        contents = await asyncio.gather(*(achunk_content(name) for name in unread))
+    read = dict(zip(unread, contents))
+    # Reranking is CPU bound
+    return await asyncio.to_thread(
+        finish_ranking, queries, ranked, read, top_k, deduplicate, reranker, diversity
+    )
+
+
+async def aretrieve_relevant_chunks_batch(
+    subject: str,
+    queries: list[str],
+    top_k: int,
+    ef_search: int | None = None,
+    deduplicate: bool = False,
+    mode: str | None = None,
+    reranker: str | None = None,
+    diversity: float | None = None,
+) -> list[list[RetrievedChunk]]:
+    reranker, diversity = reranking.resolve_reranking(reranker, diversity)
+    options = (top_k, ef_search, deduplicate, mode, reranker, diversity)
+    if not uses_result_cache(deduplicate):
+        return await asearch_chunks_batch(subject, queries, *options)
+
+    keys = await async_db.run_blocking(
+        result_cache.result_keys,
+        subject,
+        queries,
+        **result_cache_options(top_k, ef_search, mode, reranker, diversity),
+    )
+    results, missing = cached_batch(keys)
+    if missing:
+        missing_queries = [queries[index] for index in missing]
+        found = await asearch_chunks_batch(subject, missing_queries, *options)
+        remember_batch(results, keys, missing, found)
+    return results
+
+
+async def aretrieve_relevant_queries_subject_filtered(
+    subject: str,
+    query: str,
+    top_k: int,
+    ef_search: int | None = None,
+    mode: str | None = None,
+    reranker: str | None = None,
+    diversity: float | None = None,
+) -> list[RetrievedChunk]:
+    [chunks] = await aretrieve_relevant_chunks_batch(
+        subject,
+        [query],
+        top_k,
+        ef_search,
+        mode=mode,
+        reranker=reranker,
+        diversity=diversity,
+    )
+    return chunks
+
+
+async def stream_with_contents(hits: list[dict]) -> AsyncIterator[RetrievedChunk]:
+    """
+    Yields the chunks of the hits in order, each as soon as its body is loaded,
+    but those whose body could not be read. At most `CHUNK_STREAM_PREFETCH`
+    bodies are read ahead of the consumer.
+    """
+
+    async def with_content(hit: dict) -> RetrievedChunk:
+        content = hit["chunk__text"] or await achunk_content(hit["chunk__file"])
+        return RetrievedChunk(
+            file=hit["chunk__file"], score=hit["score"], content=content
+        )
+
+    pending = deque()
+    try:
+        for hit in hits:
+            pending.append(asyncio.ensure_future(with_content(hit)))
+            if (
+                len(pending) >= settings.CHUNK_STREAM_PREFETCH
+                and (chunk := await pending.popleft()).content
+            ):
+                yield chunk
+        while pending:
+            if (chunk := await pending.popleft()).content:
+                yield chunk
+    finally:
+        # The client may disconnect mid-stream
+        for task in pending:
+            task.cancel()
+
+
+async def astream_relevant_chunks(
+    subject: str,
+    query: str,
+    top_k: int,
+    ef_search: int | None = None,
+    mode: str | None = None,
+    reranker: str | None = None,
+    diversity: float | None = None,
+) -> AsyncIterator[RetrievedChunk]:
+    """
+    Ranks the chunks, then returns an iterator loading their bodies, so that
+    the failures of the search surface before anything is streamed. Reranking
+    needs every body first, in which case the chunks come all at once, as they
+    do from the result cache. A stream read to its end is cached.
+    """
+    reranker, diversity = reranking.resolve_reranking(reranker, diversity)
+    chunks = None
+    keys = None
+    if reranker or diversity:
+        chunks = await aretrieve_relevant_queries_subject_filtered(
+            subject, query, top_k, ef_search, mode, reranker, diversity
+        )
+    elif uses_result_cache(deduplicate=False):
+        options = result_cache_options(top_k, ef_search, mode, reranker, diversity)
+        keys = await async_db.run_blocking(
+            result_cache.result_keys, subject, [query], **options
+        )
+        [chunks] = result_cache.cached_results(keys)
+
+    if chunks is not None:
+
+        async def loaded() -> AsyncIterator[RetrievedChunk]:
+            for chunk in chunks:
+                yield chunk
+
+        return loaded()
+
+    modes = [lexical_search.retrieval_mode(query, mode)]
+    [hits] = await arank_candidates(subject, [query], modes, top_k, ef_search)
+    stream = stream_with_contents(hits[:top_k])
+    if keys is None:
+        return stream
+    return remembered_stream(stream, keys)
+
+
+async def remembered_stream(
+    chunks: AsyncIterator[RetrievedChunk], keys: list[str]
+) -> AsyncIterator[RetrievedChunk]:
+    """Yields the chunks, and caches them under `keys` once all are streamed"""
+    streamed = []
+    async for chunk in chunks:
+        streamed.append(chunk)
+        yield chunk
+    # A client disconnecting mid-stream leaves the result incomplete, uncached
+    result_cache.remember_results(keys, [streamed])
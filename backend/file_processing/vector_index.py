@@ -0,0 +1,150 @@
+"""
+Exact nearest neighbour search over the query vectors, in process, for the
+database backends without pgvector (SQLite in local development and on edge
+deployments).
+
+The vectors of every embedding model are loaded into one contiguous,
+L2-normalized float32 matrix, with the rows ordered by chunk, so the best
+query of every chunk is a single `reduceat` away. The matrix is versioned
+with the `search_index` generation (see `result_cache`) and reloaded when it
+has moved.
+
+The matrix holds all the vectors of the model, not only those the subject of
+a search may read: one copy per process serves every subject, whose access is
+applied as a mask of the chunks. It takes 4 bytes per dimension of every
+vector (about 1.2 GB for 100,000 vectors of 3072 dimensions), which bounds
+the deployments this search suits.
+"""
+
+import logging
+from dataclasses import dataclass
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+
+from file_processing.generations import current_generation
+from file_processing.models import Chunk, QueryVector
+from file_processing.result_cache import SEARCH_INDEX_GENERATION
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class VectorIndex:
+    generation: int
+    # (vectors, dimensions), unit rows ordered by chunk
+    matrix: np.ndarray
+    # first row of every chunk in `matrix`
+    chunk_starts: np.ndarray
+    chunk_ids: np.ndarray
+    knowledge_source_ids: np.ndarray
+
+
+_index_lock = Lock()
+# embedding model -> its index
+_indexes: dict[str, VectorIndex] = {}
+
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def load_vector_index(generation: int, embedding_model: str) -> VectorIndex:
+    rows = (
+        QueryVector.objects.filter(
+            vector__isnull=False, embedding_model=embedding_model
+        )
+        # The unresolved chunk of legacy vectors (see migration 0011)
+        .exclude(chunk__file="")
+        .order_by("chunk_id")
+        .values_list("chunk_id", "knowledge_source_id", "vector")
+    )
+    chunk_of_row, knowledge_source_of_row, vectors = [], [], []
+    for chunk_id, knowledge_source_id, vector in rows.iterator(chunk_size=2000):
+        chunk_of_row.append(chunk_id)
+        knowledge_source_of_row.append(knowledge_source_id)
+        vectors.append(np.asarray(vector, dtype=np.float32))
+
+    if not vectors:
+        empty = np.empty(0, dtype=np.int64)
+        return VectorIndex(
+            generation, np.empty((0, 0), np.float32), empty, empty, empty
+        )
+
+    chunk_of_row = np.asarray(chunk_of_row)
+    is_first_of_chunk = np.r_[True, chunk_of_row[1:] != chunk_of_row[:-1]]
+    chunk_starts = np.flatnonzero(is_first_of_chunk)
+    matrix = np.ascontiguousarray(normalized(np.stack(vectors)))
+    logger.info(
+        f"Loaded {len(matrix)} query vectors of {embedding_model=} at {generation=}"
+        f" ({matrix.nbytes / 2**20:.0f} MiB)"
+    )
+    return VectorIndex(
+        generation=generation,
+        matrix=matrix,
+        chunk_starts=chunk_starts,
+        chunk_ids=chunk_of_row[chunk_starts],
+        knowledge_source_ids=np.asarray(knowledge_source_of_row)[chunk_starts],
+    )
+
+
+def vector_index(embedding_model: str) -> VectorIndex:
+    generation = current_generation(SEARCH_INDEX_GENERATION)
+    with _index_lock:
+        index = _indexes.get(embedding_model)
+        if index is None or index.generation != generation:
+            index = _indexes[embedding_model] = load_vector_index(
+                generation, embedding_model
+            )
+        return index
+
+
+def nearest_chunks(
+    knowledge_source_ids: frozenset[int],
+    embeddings: list[list[float]],
+    top_k: int,
+    embedding_model: str | None = None,
+) -> list[dict]:
+    """
+    Counterpart of `utils.rank_chunks_for_queries`: the `top_k` chunks of the
+    given knowledge sources nearest to every embedding, among the vectors of
+    the embedding model (the active one by default), as
+    `{"chunk_id", "chunk__file", "chunk__text", "distance", "query_index"}`
+    rows, best first for every query.
+    """
+    index = vector_index(embedding_model or settings.EMBEDDING_MODEL)
+    accessible = np.isin(index.knowledge_source_ids, list(knowledge_source_ids))
+    k = min(top_k, int(accessible.sum()))
+    if k == 0:
+        return []
+
+    queries = normalized(np.asarray(embeddings, dtype=np.float32))
+    # One matrix product for the whole batch. Masking the inaccessible chunks
+    # afterwards is cheaper than gathering the accessible rows into a copy.
+    similarities = index.matrix @ queries.T
+    best = np.maximum.reduceat(similarities, index.chunk_starts, axis=0)
+    best[~accessible] = -np.inf
+    top = np.argpartition(-best, k - 1, axis=0)[:k]
+
+    hits = []
+    for query_index in range(len(queries)):
+        chunk_rows = top[:, query_index]
+        chunk_rows = chunk_rows[np.argsort(-best[chunk_rows, query_index])]
+        hits.extend(
+            {
+                "chunk_id": int(index.chunk_ids[row]),
+                "distance": float(1 - best[row, query_index]),
+                "query_index": query_index,
+            }
+            for row in chunk_rows
+        )
+
+    chunks = Chunk.objects.in_bulk({hit["chunk_id"] for hit in hits})
+    for hit in hits:
+        chunk = chunks.get(hit["chunk_id"])
+        hit["chunk__file"] = chunk.file.name if chunk else ""
+        hit["chunk__text"] = chunk.text if chunk else ""
+    return [hit for hit in hits if hit["chunk__file"]]
@@ -1,18 +1,26 @@
 from dataclasses import dataclass
 import logging
 from shutil import rmtree
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, serializers
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
 from content_extraction.process import process_file
 import uuid_utils as uuid
 
-from file_processing.models import KnowledgeSource, QueryVector
-from file_processing.utils import embed_content
-from file_processing.hypo_query_generation import QueryGenerator
+from file_processing.deduplication import (
+    indexed_twin,
+    reuse_indexed_twin,
+    twin_vectors,
+)
+from file_processing.models import Chunk, KnowledgeSource, QueryVector
+from file_processing.reindexing import is_indexed, remove_stale_chunks
+from file_processing.embedders import active_embedder, embed_in_batches
+from file_processing.result_cache import invalidate_search_index
+from file_processing.hypo_query_generation import QueryGenerator, Questions
 from file_processing.section_digest_formatters import default_xml_formatter
 import xml.etree.ElementTree as ET
 from functools import partial
@@ -45,6 +53,8 @@ class EventarcMessageSerializer(serializers.Serializer):
 
 
 PROCESS_RESULTS_FOLDER = "process-results"
+# Results indexed in process by the "direct" pipeline are marked in their METADATA
+DIRECT_PIPELINE_MARK = "Pipeline: direct"
 
 
 class EventarcHandler(APIView):
@@ -65,6 +75,8 @@ def process_eventarc_message(serializer: EventarcMessageSerializer):
         """
         return Response(status=status.HTTP_204_NO_CONTENT)
     if object_name.startswith(settings.UPLOAD_FOLDER_NAME):
+        # With the direct pipeline, the whole document is indexed before the
+        # task is acknowledged: it is retried if the instance stops midway
         process_file_to_sections(object_name)
         return Response(status=status.HTTP_204_NO_CONTENT)
     if (
@@ -89,13 +101,24 @@ def process_eventarc_message(serializer: EventarcMessageSerializer):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-def process_file_to_sections(object_name: str):
+def process_file_to_sections(object_name: str, pipeline: str | None = None):
+    """
+    Extracts the chunks of the uploaded file. With the "events" pipeline each
+    saved chunk is then indexed on its own storage event (see `index_chunk`);
+    with the "direct" pipeline the whole document is indexed right away, and
+    the events of its results are ignored. Either way, only the chunks changed
+    since a previous version of the file are indexed (see `reindexing`). The
+    chunks of the document, and with the direct pipeline their vectors, are
+    written in one transaction, so a failure leaves no chunk behind unindexed.
+    """
+    pipeline = pipeline or settings.INGESTION_PIPELINE
     file_id = str(uuid.uuid7())
     output_dir = settings.PRIVATE_MOUNT / PROCESS_RESULTS_FOLDER / file_id
 
     _, owner_username, filename = object_name.split("/")
     file_db_name = "/".join((owner_username, filename))
-    if not KnowledgeSource.objects.filter(file=file_db_name).exists():
+    ks = KnowledgeSource.objects.filter(file=file_db_name).first()
+    if ks is None:
         """
         It is possible for the file to have been uploaded by a user in an admin panel.
         If that is the case, we already have a KnowledgeSource object for it.
@@ -109,6 +132,8 @@ def process_file_to_sections(object_name: str):
     with open(output_dir / "METADATA", "w", encoding="utf-8") as f:
         f.write(f"Original Filename: {object_name}\n")
         f.write(f"Original Owner ID: {owner_username}\n")
+        if pipeline == "direct":
+            f.write(f"{DIRECT_PIPELINE_MARK}\n")
 
     try:
         chunks = process_file(
@@ -121,19 +146,23 @@ def process_file_to_sections(object_name: str):
 
     chunk_dir = output_dir / "chunks"
     os.makedirs(chunk_dir, exist_ok=True)
-    save_chunk_to_dir = partial(save_chunk, chunk_dir)
+    write_chunk_to_dir = partial(write_chunk, chunk_dir)
 
     try:
-        any(map(save_chunk_to_dir, chunks))
+        chunk_names = list(map(write_chunk_to_dir, chunks))
+        if pipeline == "direct":
+            index_document(ks, chunk_names, chunks, output_dir / "queries")
+        else:
+            store_document(ks, chunk_names, chunks)
     except Exception as e:
         logger.error(f"Error processing chunks for file {object_name}: {e}")
         rmtree(chunk_dir)
         return None
-
     return chunks
 
 
-def save_chunk(chunk_dir, chunk):
+def write_chunk(chunk_dir, chunk) -> str:
+    """Saves the chunk to a file of `chunk_dir`, returns its object name"""
     digest_hash: str = chunk.get("digest_hash")
     if not digest_hash:
         raise ValueError("No digest hash found")
@@ -141,20 +170,198 @@ def save_chunk(chunk_dir, chunk):
     file_path = chunk_dir / filename
     with open(file_path, "w") as f:
         json.dump(chunk, f)
+    return str(file_path.relative_to(settings.PRIVATE_MOUNT))
 
 
-def insert_vector(
-    object_name: str, knowledge_source: KnowledgeSource, content_embedding: list[float]
-):
-    logger.info(f"Started Inserting vector for {object_name=}")
-    qv = QueryVector(
+def store_document(
+    knowledge_source: KnowledgeSource,
+    chunk_names: list[str],
+    contents: list[dict[str, Any]],
+    vectors_of_chunk: Callable[[Chunk, int], list[QueryVector]] | None = None,
+) -> list[Chunk]:
+    """
+    Stores the chunks of a document, and the vectors `vectors_of_chunk` builds
+    for them, in one transaction. A new version of the file: the chunks left
+    are those of the previous one, they are deleted.
+    """
+    with transaction.atomic():
+        chunks = [
+            store_chunk(knowledge_source, chunk_name, content)
+            for chunk_name, content in zip(chunk_names, contents)
+        ]
+        remove_stale_chunks(knowledge_source, [chunk.digest_hash for chunk in chunks])
+        if vectors_of_chunk is not None:
+            vectors = [
+                vector
+                for index, chunk in enumerate(chunks)
+                for vector in vectors_of_chunk(chunk, index)
+            ]
+            QueryVector.objects.bulk_create(vectors, batch_size=1000)
+    # Chunks are written one by one, the search index is invalidated once
+    invalidate_search_index()
+    return chunks
+
+
+def store_chunk(knowledge_source: KnowledgeSource, object_name: str, chunk) -> Chunk:
+    """
+    Creates (or refreshes) the database copy of the chunk saved as `object_name`.
+    The caller invalidates the search index, once for all the chunks it stores.
+    """
+    stored_chunk, _ = Chunk.objects.update_or_create(
         knowledge_source=knowledge_source,
-        vector=content_embedding,
-        embedding_model="text-embedding-3-large",
-    )  # Hardcoded embedding model for now (TODO: FIX)
-    qv.file.name = object_name
-    qv.save()
-    logger.info(f"Done Inserting vector for {object_name=}")
+        digest_hash=chunk["digest_hash"],
+        defaults={
+            "file": object_name,
+            "title": chunk.get("title") or "",
+            "text": chunk.get("text") or "",
+        },
+    )
+    return stored_chunk
+
+
+def results_metadata(object_name: str) -> str:
+    """METADATA of the processing results `object_name` belongs to"""
+    path_to_metadata = (
+        settings.PRIVATE_MOUNT / Path(object_name).parent.parent / "METADATA"
+    )
+    with open(path_to_metadata, encoding="utf-8") as f:
+        return f.read()
+
+
+def knowledge_source_of_results(
+    object_name: str, metadata: str | None = None
+) -> KnowledgeSource:
+    """Knowledge source whose processing results `object_name` belongs to"""
+    if metadata is None:
+        metadata = results_metadata(object_name)
+    text_to_find = "Original Filename: "
+    position_start = metadata.find(text_to_find)
+    filename = metadata[position_start + len(text_to_find) : metadata.find("\n")]
+    ks_filename = filename[len("django-uploads/") :]
+    return KnowledgeSource.objects.get(file=ks_filename)
+
+
+def query_vectors(
+    chunk: Chunk,
+    queries: list[str],
+    embeddings: list[list[float]],
+    embedding_model: str,
+) -> list[QueryVector]:
+    return [
+        QueryVector(
+            knowledge_source_id=chunk.knowledge_source_id,
+            chunk=chunk,
+            query=query,
+            vector=embedding,
+            embedding_model=embedding_model,
+        )
+        for query, embedding in zip(queries, embeddings)
+    ]
+
+
+def bulk_insert_vectors(vectors: list[QueryVector]):
+    with transaction.atomic():
+        QueryVector.objects.bulk_create(vectors, batch_size=1000)
+    invalidate_search_index()
+
+
+def insert_vectors(
+    chunk: Chunk,
+    queries: list[str],
+    embeddings: list[list[float]],
+    embedding_model: str,
+):
+    """Inserts the vectors of the queries of the chunk, in one transaction"""
+    logger.info(f"Started Inserting {len(queries)} vectors for {chunk.file.name=}")
+    bulk_insert_vectors(query_vectors(chunk, queries, embeddings, embedding_model))
+    logger.info(f"Done Inserting vectors for {chunk.file.name=}")
+
+
+def index_document(
+    knowledge_source: KnowledgeSource,
+    chunk_names: list[str],
+    contents: list[dict[str, Any]],
+    path_to_queries: Path,
+):
+    """
+    The "direct" pipeline: generates the queries of all the chunks of a
+    document concurrently (see `QueryGenerator.generate_many`), embeds them in
+    as few requests as possible, then stores the chunks and all their vectors
+    in one transaction. Chunks already indexed (unchanged since a previous
+    version of the document) are skipped, and those whose digest is indexed
+    elsewhere reuse its queries. The query files are only written as an audit
+    trail, with `INGESTION_QUERY_ARTIFACTS`.
+    """
+    logger.info(f"Started indexing {len(contents)} chunks in process")
+    embedder = active_embedder()
+    stored = {
+        chunk.digest_hash: chunk
+        for chunk in Chunk.objects.filter(knowledge_source=knowledge_source)
+    }
+    # Unchanged chunks of a previous version of the document keep their vectors
+    pending = {}
+    twins = {}
+    for index, content in enumerate(contents):
+        chunk = stored.get(content["digest_hash"]) or Chunk(
+            knowledge_source=knowledge_source, digest_hash=content["digest_hash"]
+        )
+        if chunk.pk is not None and is_indexed(chunk, embedder.model):
+            continue
+        twin = (
+            indexed_twin(chunk, embedder.model)
+            if settings.CHUNK_DEDUPLICATION
+            else None
+        )
+        if twin is None:
+            pending[index] = content
+        else:
+            twins[index] = twin
+    logger.info(
+        f"{len(contents) - len(pending) - len(twins)} chunks already indexed, "
+        f"{len(twins)} reused"
+    )
+    generated = dict(
+        zip(
+            pending,
+            (
+                [query.query for query in questions_to_queries(questions)]
+                for questions in query_generator.generate_many(list(pending.values()))
+            ),
+        )
+    )
+    if settings.INGESTION_QUERY_ARTIFACTS:
+        os.makedirs(path_to_queries, exist_ok=True)
+        for index, queries in generated.items():
+            save_queries_to_file(
+                path_to_queries,
+                chunk_names[index],
+                [Query(query) for query in queries],
+            )
+
+    embeddings = iter(
+        embed_in_batches(
+            embedder, [query for queries in generated.values() for query in queries]
+        )
+    )
+    embedded = {
+        index: [next(embeddings) for _ in queries]
+        for index, queries in generated.items()
+    }
+
+    def vectors_of_chunk(chunk: Chunk, index: int) -> list[QueryVector]:
+        if index in twins:
+            return twin_vectors(chunk, twins[index])
+        if index in generated:
+            return query_vectors(
+                chunk, generated[index], embedded[index], embedder.model
+            )
+        return []
+
+    store_document(knowledge_source, chunk_names, contents, vectors_of_chunk)
+    logger.info(
+        f"Finished indexing {len(contents)} chunks, "
+        f"{sum(map(len, generated.values()))} queries"
+    )
 
 
 def index_chunk(object_name: str):
@@ -165,6 +372,21 @@ def index_chunk(object_name: str):
     file_path = str(settings.PRIVATE_MOUNT / object_name)
     with open(file_path, encoding="utf-8") as f:
         data = json.load(f)
+    metadata = results_metadata(object_name)
+    if DIRECT_PIPELINE_MARK in metadata:
+        logger.info(f"Skipping {object_name=}, indexed by the direct pipeline")
+        return
+    chunk = store_chunk(
+        knowledge_source_of_results(object_name, metadata), object_name, data
+    )
+    invalidate_search_index()
+    embedding_model = active_embedder().model
+    if is_indexed(chunk, embedding_model):
+        logger.info(f"Skipping {object_name=}, already indexed")
+        return
+    if settings.CHUNK_DEDUPLICATION and reuse_indexed_twin(chunk, embedding_model):
+        logger.info(f"Finished indexing {object_name=}, reused an indexed twin")
+        return
     queries = generate_queries(data)
 
     path_to_file_processing_root: Path = (
@@ -174,9 +396,8 @@ def index_chunk(object_name: str):
     os.makedirs(path_to_queries, exist_ok=True)
     logger.info(f"Created {path_to_queries=}")
 
-    save_query_to_queries_dir = partial(save_query_to_file, path_to_queries)
     try:
-        any(map(save_query_to_queries_dir, queries))
+        save_queries_to_file(path_to_queries, object_name, list(queries))
     except ValueError as e:
         logger.error(f"Error generating queries for {object_name}. Error message: {e}")
         rmtree(path_to_queries)
@@ -197,27 +418,37 @@ def generate_queries(data: dict[str, str | dict[str, Any]]) -> Iterable[Query]:
     Returns an Iterable[Query] of query and answer for a given object_name.
     """
 
-    queries = query_generator(data)
-    if queries is None:
+    yield from questions_to_queries(query_generator(data))
+
+
+def questions_to_queries(questions: Questions | None) -> Iterable[Query]:
+    if questions is None:
         logger.error("Failed to generate queries")
         return
-    list_of_queries = queries.questions
-    for query in list_of_queries:
+    for query in questions.questions:
         yield Query(query)
 
 
-def save_query_to_file(path_to_queries: Path, query: Query):
-    query_str = query.query
+def save_queries_to_file(path_to_queries: Path, chunk_name: str, queries: list[Query]):
+    """
+    Saves all the queries of the chunk to one file, so that they are embedded
+    and inserted together (see `process_query`)
+    """
+    if not queries:
+        return
 
     root = ET.Element("root")
-    query_element = ET.SubElement(root, "query")
-    query_element.text = query_str
+    for query in queries:
+        query_element = ET.SubElement(root, "query")
+        query_element.text = query.query
+    chunk_element = ET.SubElement(root, "chunk")
+    chunk_element.text = chunk_name
     xml_string = ET.tostring(root, "utf-8")
 
     path_to_query = path_to_queries / f"{uuid.uuid4()}.xml"
     with open(path_to_query, "wb") as f:
         f.write(xml_string)
-    logger.info(f"Saved query to {path_to_query=}")
+    logger.info(f"Saved {len(queries)} queries to {path_to_query=}")
 
 
 def process_query(object_name: str):
@@ -225,27 +456,31 @@ def process_query(object_name: str):
     try:
         tree = ET.parse(file_path)
         root = tree.getroot()
-        query_element = root.find("query")
-        if query_element is None or not query_element.text:
+        queries = [element.text for element in root.findall("query") if element.text]
+        if not queries:
             raise ValueError(f"Query not found in {object_name}")
-        query = query_element.text
+        chunk_name = root.findtext("chunk")
     except (ET.ParseError, ValueError) as e:
         logger.error(f"Error processing query from {object_name}")
         logger.exception(e)
         return
+    if not chunk_name:
+        # Saved before the queries named their chunk: they cannot be linked to it
+        logger.warning(f"Skipping {object_name=}, its chunk is unknown")
+        return
 
-    path_to_metadata = (
-        settings.PRIVATE_MOUNT / Path(object_name).parent.parent / "METADATA"
+    metadata = results_metadata(object_name)
+    if DIRECT_PIPELINE_MARK in metadata:
+        logger.info(f"Skipping {object_name=}, indexed by the direct pipeline")
+        return
+    ks = knowledge_source_of_results(object_name, metadata)
+    chunk, _ = Chunk.objects.get_or_create(
+        knowledge_source=ks,
+        digest_hash=Path(chunk_name).stem,
+        defaults={"file": chunk_name},
     )
-    with open(path_to_metadata, encoding="utf-8") as f:
-        metadata = f.read()
-    text_to_find = "Original Filename: "
-    position_start = metadata.find(text_to_find)
-    filename = metadata[position_start + len(text_to_find) : metadata.find("\n")]
-    ks_filename = filename[len("django-uploads/") :]
-    ks = KnowledgeSource.objects.get(file=ks_filename)
-    embeddings = embed_content(query)
-    insert_vector_to_chunk = partial(insert_vector, object_name, ks)
-    any(map(insert_vector_to_chunk, embeddings))
+    embedder = active_embedder()
+    embeddings = embed_in_batches(embedder, queries)
+    insert_vectors(chunk, queries, embeddings, embedder.model)
 
     logger.info(f"Done indexing {object_name=}")
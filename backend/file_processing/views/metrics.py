@@ -0,0 +1,32 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.permissions import BasePermission
+from rest_framework.views import APIView
+
+from file_processing.timings import prometheus_text
+
+
+class HasMetricsToken(BasePermission):
+    """The scraper sends `METRICS_TOKEN` as a bearer token, not a user's credentials"""
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        auth_header = request.META.get("HTTP_AUTHORIZATION", "")
+        return bool(token) and hmac.compare_digest(
+            auth_header.encode(), f"Bearer {token}".encode()
+        )
+
+
+class MetricsView(APIView):
+    """
+    Retrieval latency histograms and query embedding cache counters, in the
+    Prometheus text exposition format
+    """
+
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(prometheus_text(), content_type="text/plain; version=0.0.4")
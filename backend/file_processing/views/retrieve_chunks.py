@@ -1,17 +1,61 @@
-from rest_framework.views import APIView
+import json
+
+from adrf.views import APIView
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import status, serializers
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+from file_processing.lexical_search import RETRIEVAL_MODES
+from file_processing.reranking import available_rerankers
+from file_processing.utils import (
+    aretrieve_relevant_chunks_batch,
+    aretrieve_relevant_queries_subject_filtered,
+    astream_relevant_chunks,
+)
+
+
+# Rerankers whose optional module is missing are rejected with a 400
+RERANKER_CHOICES = ["none", *available_rerankers()]
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON, one chunk per line (`stream` mode)"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
 
-from file_processing.utils import retrieve_relevant_queries_subject_filtered
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only the non streamed responses (errors) go through the renderer
+        return json.dumps(data).encode() + b"\n"
+
+
+async def ndjson_lines(chunks):
+    async for chunk in chunks:
+        line = {"content": chunk.content, "score": chunk.score}
+        yield json.dumps(line).encode() + b"\n"
 
 
 class RetrieveTextForQuerySerializer(serializers.Serializer):
     query = serializers.CharField()
     top_k = serializers.IntegerField(default=20, min_value=1, max_value=100)
+    # Recall/latency trade-off of the ANN index scan (`hnsw.ef_search`)
+    ef_search = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    # "vector", "lexical", "hybrid" or "auto" (see `RETRIEVAL_MODE`)
+    mode = serializers.ChoiceField(choices=RETRIEVAL_MODES, required=False)
+    # Reranking of over-fetched candidates (see `RERANKER`, `RERANK_DIVERSITY`)
+    reranker = serializers.ChoiceField(choices=RERANKER_CHOICES, required=False)
+    diversity = serializers.FloatField(required=False, min_value=0, max_value=1)
+    # Stream the chunks as NDJSON lines, as does `Accept: application/x-ndjson`
+    stream = serializers.BooleanField(default=False)
 
 
 class RetrieveTextForQueryAPIView(APIView):
-    def post(self, request, *args, **kwargs):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    async def post(self, request, *args, **kwargs):
         serializer = RetrieveTextForQuerySerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -19,13 +63,81 @@ class RetrieveTextForQueryAPIView(APIView):
         user = request.user
         query = serializer.validated_data["query"]
         top_k = serializer.validated_data["top_k"]
+        ef_search = serializer.validated_data.get("ef_search")
+        mode = serializer.validated_data.get("mode")
+        reranker = serializer.validated_data.get("reranker")
+        diversity = serializer.validated_data.get("diversity")
+
+        stream = serializer.validated_data["stream"]
+        if stream or request.accepted_renderer.format == NDJSONRenderer.format:
+            chunks = await astream_relevant_chunks(
+                user.username, query, top_k, ef_search, mode, reranker, diversity
+            )
+            return StreamingHttpResponse(
+                ndjson_lines(chunks), content_type=NDJSONRenderer.media_type
+            )
+
+        chunks = await aretrieve_relevant_queries_subject_filtered(
+            user.username, query, top_k, ef_search, mode, reranker, diversity
+        )
+        return Response(
+            {
+                "contents": [chunk.content for chunk in chunks],
+                "scores": [chunk.score for chunk in chunks],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class RetrieveTextForQueriesSerializer(serializers.Serializer):
+    queries = serializers.ListField(
+        child=serializers.CharField(), min_length=1, max_length=32
+    )
+    top_k = serializers.IntegerField(default=20, min_value=1, max_value=100)
+    ef_search = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    # "vector", "lexical", "hybrid" or "auto" (see `RETRIEVAL_MODE`)
+    mode = serializers.ChoiceField(choices=RETRIEVAL_MODES, required=False)
+    # Reranking of over-fetched candidates (see `RERANKER`, `RERANK_DIVERSITY`)
+    reranker = serializers.ChoiceField(choices=RERANKER_CHOICES, required=False)
+    diversity = serializers.FloatField(required=False, min_value=0, max_value=1)
+    # Return every chunk only once, for the query it is most relevant to
+    deduplicate = serializers.BooleanField(default=False)
+
+
+class RetrieveTextForQueriesAPIView(APIView):
+    async def post(self, request, *args, **kwargs):
+        serializer = RetrieveTextForQueriesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        queries = serializer.validated_data["queries"]
+        top_k = serializer.validated_data["top_k"]
+        ef_search = serializer.validated_data.get("ef_search")
+        mode = serializer.validated_data.get("mode")
+        reranker = serializer.validated_data.get("reranker")
+        diversity = serializer.validated_data.get("diversity")
+        deduplicate = serializer.validated_data["deduplicate"]
 
-        filtered_non_empty = retrieve_relevant_queries_subject_filtered(
-            user.username, query, top_k
+        results = await aretrieve_relevant_chunks_batch(
+            user.username,
+            queries,
+            top_k,
+            ef_search,
+            deduplicate,
+            mode,
+            reranker,
+            diversity,
         )
         return Response(
             {
-                "contents": filtered_non_empty,
+                "results": [
+                    {
+                        "contents": [chunk.content for chunk in chunks],
+                        "scores": [chunk.score for chunk in chunks],
+                    }
+                    for chunks in results
+                ]
             },
             status=status.HTTP_200_OK,
         )
@@ -234,6 +234,7 @@ resource "google_cloud_run_v2_service" "application_backend" {
 
   template {
     service_account = local.cloudrun_service_account.email
+    timeout         = "${var.request_timeout_seconds}s"
 
     scaling {
       min_instance_count = var.min_instance_count
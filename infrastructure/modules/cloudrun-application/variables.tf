@@ -52,6 +52,12 @@ variable "max_instance_count" {
   default     = 1
 }
 
+variable "request_timeout_seconds" {
+  description = "Timeout of the requests to the service, which index whole documents with the direct ingestion pipeline (at most 3600)."
+  type        = number
+  default     = 1800
+}
+
 variable "include_jaeger_container" {
   description = "Whether to include the Jaeger sidecar container for tracing."
   type        = bool
@@ -1,5 +1,6 @@
 import functions_framework
 from google.cloud import tasks_v2
+from google.protobuf import duration_pb2
 import json
 import logging
 import os
@@ -13,6 +14,9 @@ QUEUE_NAME = os.environ.get("QUEUE_NAME")
 CLOUD_RUN_URL = os.environ.get("CLOUD_RUN_URL", "").rstrip("/")
 CLOUD_RUN_AUDIENCE = os.environ.get("CLOUD_RUN_AUDIENCE", CLOUD_RUN_URL)
 CLOUD_TASKS_SA_EMAIL = os.environ.get("CLOUD_TASKS_SA_EMAIL")
+TASK_DISPATCH_DEADLINE_SECONDS = int(
+    os.environ.get("TASK_DISPATCH_DEADLINE_SECONDS", "1800")
+)
 
 
 @functions_framework.cloud_event
@@ -78,7 +82,10 @@ def enqueue_processing_task(gcs_data):
                 "service_account_email": CLOUD_TASKS_SA_EMAIL,
                 "audience": CLOUD_RUN_AUDIENCE,
             },
-        }
+        },
+        "dispatch_deadline": duration_pb2.Duration(
+            seconds=TASK_DISPATCH_DEADLINE_SECONDS
+        ),
     }
 
     response = client.create_task(request={"parent": parent, "task": task})
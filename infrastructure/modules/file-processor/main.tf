@@ -157,11 +157,12 @@ resource "google_cloudfunctions2_function" "gcs_processor" {
     timeout_seconds    = 60
 
     environment_variables = {
-      GCP_PROJECT          = var.google_project_id
-      GCP_REGION           = "europe-west1"
-      QUEUE_NAME           = google_cloud_tasks_queue.file_processing_queue.name
-      CLOUD_RUN_URL        = local.cloud_run_url
-      CLOUD_TASKS_SA_EMAIL = google_service_account.cloud_tasks_sa.email
+      GCP_PROJECT                    = var.google_project_id
+      GCP_REGION                     = "europe-west1"
+      QUEUE_NAME                     = google_cloud_tasks_queue.file_processing_queue.name
+      CLOUD_RUN_URL                  = local.cloud_run_url
+      CLOUD_TASKS_SA_EMAIL           = google_service_account.cloud_tasks_sa.email
+      TASK_DISPATCH_DEADLINE_SECONDS = var.task_dispatch_deadline_seconds
     }
 
     # Use dedicated Cloud Function service account
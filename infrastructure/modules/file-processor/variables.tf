@@ -39,3 +39,9 @@ variable "pubsub_topic_name" {
   default     = ""
   description = "Pub/Sub topic name for Eventarc to publish into (default: <app>-eventarc-topic)"
 }
+
+variable "task_dispatch_deadline_seconds" {
+  type        = number
+  default     = 1800
+  description = "How long a processing task waits for the service to answer before it is retried (at most 1800, the Cloud Tasks limit)"
+}
@@ -17,16 +17,18 @@ TOKEN = os.getenv("KNOWLEDGE_USER_TOKEN")
 URL_BASE = os.getenv("KNOWLEDGE_URL_BASE")
 
 
-async def make_get_chunks_request(query: str) -> dict[str, Any] | None:
+async def make_knowledge_request(
+    path: str, payload: dict[str, Any]
+) -> dict[str, Any] | None:
     """
     Make a request to the knowledge API
     """
 
-    url = urljoin(URL_BASE, "/get-chunks/")
+    url = urljoin(URL_BASE, path)
     options = {
         "url": url,
         "headers": {"Authorization": f"Token {TOKEN}"},
-        "data": {"query": query},
+        "json": payload,
         "timeout": 30.0,
     }
     logger.debug(f"Making request to {url} with {options=}")
@@ -46,6 +48,10 @@ async def make_get_chunks_request(query: str) -> dict[str, Any] | None:
             return None
 
 
+async def make_get_chunks_request(query: str) -> dict[str, Any] | None:
+    return await make_knowledge_request("/get-chunks/", {"query": query})
+
+
 def format_chunks(chunks: list[str]) -> str:
     return "\n---\n".join(chunks)
 
@@ -65,8 +71,28 @@ async def get_chunks(query: str) -> str:
     return format_chunks(chunks)
 
 
+async def get_chunks_batch(queries: list[str]) -> str:
+    """
+    Retrieves the relevant text chunks for each of the queries, from the knowledge API,
+    in a single request. Every chunk is returned once, under the query it is most relevant to.
+    """
+    data = await make_knowledge_request(
+        "/get-chunks/batch/", {"queries": queries, "deduplicate": True}
+    )
+    if data is None:
+        return "Failed to retrieve data from the knowledge API..."
+    results = data.get("results", None)
+    if results is None:
+        return 'Could not find the "results" field in the response'
+    return "\n\n".join(
+        f"# {query}\n{format_chunks(result['contents'])}"
+        for query, result in zip(queries, results)
+    )
+
+
 # mcp.resource("resource://{query}")(get_chunks)
 mcp.tool()(get_chunks)
+mcp.tool()(get_chunks_batch)
 
 
 if __name__ == "__main__":